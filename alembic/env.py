@@ -21,9 +21,21 @@ if config.config_file_name is not None:
 # target_metadata = None
 
 ##
+from decouple import config as env_config
 from app.models import Base
 target_metadata = Base.metadata
 
+# DATABASE_URL from the environment wins over alembic.ini, same as the app
+if env_config("DATABASE_URL", default=None):
+    config.set_main_option("sqlalchemy.url", env_config("DATABASE_URL").replace("%", "%%"))
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # The FTS5 virtual table and its shadow tables are managed by hand
+    if type_ == "table" and name.startswith("books_fts"):
+        return False
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -48,6 +60,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -69,7 +82,8 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            include_object=include_object
         )
 
         with context.begin_transaction():
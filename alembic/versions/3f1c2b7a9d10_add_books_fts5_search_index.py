@@ -0,0 +1,58 @@
+"""Add FTS5 search index over books
+
+Revision ID: 3f1c2b7a9d10
+Revises: 8da948186dbb
+Create Date: 2025-01-20 10:12:41.204381
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2b7a9d10'
+down_revision: Union[str, None] = '8da948186dbb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # Step 1: External-content FTS5 table, so book text is not stored twice
+    op.execute("""
+    CREATE VIRTUAL TABLE books_fts USING fts5(
+        title, author, summary, genre,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """)
+
+    # Step 2: Triggers keep the index in the same transaction as every write
+    op.execute("""
+    CREATE TRIGGER books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, summary, genre)
+        VALUES (new.id, new.title, new.author, new.summary, new.genre);
+    END
+    """)
+    op.execute("""
+    CREATE TRIGGER books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, summary, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.summary, old.genre);
+    END
+    """)
+    op.execute("""
+    CREATE TRIGGER books_fts_au AFTER UPDATE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, summary, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.summary, old.genre);
+        INSERT INTO books_fts(rowid, title, author, summary, genre)
+        VALUES (new.id, new.title, new.author, new.summary, new.genre);
+    END
+    """)
+
+    # Step 3: Index the rows that already exist
+    op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS books_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS books_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS books_fts_ai")
+    op.execute("DROP TABLE IF EXISTS books_fts")
@@ -0,0 +1,36 @@
+"""Add book_stats aggregate table
+
+Revision ID: 5a8d2f6c9e14
+Revises: e41a9c3f7d62
+Create Date: 2025-01-27 09:41:18.530274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a8d2f6c9e14'
+down_revision: Union[str, None] = 'e41a9c3f7d62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    op.create_table(
+        'book_stats',
+        sa.Column('kind', sa.String, primary_key=True),
+        sa.Column('name', sa.String, primary_key=True),
+        sa.Column('count', sa.Integer, nullable=False),
+    )
+    op.create_index('ix_book_stats_kind_count', 'book_stats', ['kind', 'count'])
+
+    # Backfill from the existing catalog; crud keeps it current from here on
+    op.execute("INSERT INTO book_stats (kind, name, count) SELECT 'total', '', COUNT(*) FROM books")
+    op.execute("INSERT INTO book_stats (kind, name, count) SELECT 'genre', genre, COUNT(*) FROM books GROUP BY genre")
+    op.execute("INSERT INTO book_stats (kind, name, count) SELECT 'author', author, COUNT(*) FROM books GROUP BY author")
+
+def downgrade():
+    op.drop_index('ix_book_stats_kind_count', table_name='book_stats')
+    op.drop_table('book_stats')
@@ -0,0 +1,33 @@
+"""Add composite indexes for book filters and sorting
+
+Revision ID: 9b4e6c1d2a57
+Revises: 3f1c2b7a9d10
+Create Date: 2025-01-21 09:47:03.518227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4e6c1d2a57'
+down_revision: Union[str, None] = '3f1c2b7a9d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # The initial migration rebuilt books without its title index
+    op.create_index('ix_books_title', 'books', ['title'], if_not_exists=True)
+    op.create_index('ix_books_author_title', 'books', ['author', 'title'])
+    op.create_index('ix_books_genre_title', 'books', ['genre', 'title'])
+    op.create_index('ix_books_author_published_date', 'books', ['author', 'published_date'])
+    op.create_index('ix_books_genre_published_date', 'books', ['genre', 'published_date'])
+    op.create_index('ix_books_published_date', 'books', ['published_date'])
+
+def downgrade():
+    op.drop_index('ix_books_published_date', table_name='books')
+    op.drop_index('ix_books_genre_published_date', table_name='books')
+    op.drop_index('ix_books_author_published_date', table_name='books')
+    op.drop_index('ix_books_genre_title', table_name='books')
+    op.drop_index('ix_books_author_title', table_name='books')
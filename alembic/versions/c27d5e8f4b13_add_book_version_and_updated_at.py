@@ -0,0 +1,28 @@
+"""Add version and updated_at to books
+
+Revision ID: c27d5e8f4b13
+Revises: 9b4e6c1d2a57
+Create Date: 2025-01-22 14:05:38.770912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c27d5e8f4b13'
+down_revision: Union[str, None] = '9b4e6c1d2a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # Existing rows start at version 1; updated_at stays empty until their next update
+    op.add_column('books', sa.Column('version', sa.Integer, nullable=False, server_default='1'))
+    op.add_column('books', sa.Column('updated_at', sa.DateTime, nullable=True))
+
+def downgrade():
+    # Plain DROP COLUMN (SQLite 3.35+) keeps the FTS triggers that a batch rebuild would lose
+    op.drop_column('books', 'updated_at')
+    op.drop_column('books', 'version')
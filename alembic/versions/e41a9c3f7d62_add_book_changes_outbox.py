@@ -0,0 +1,36 @@
+"""Add book_changes change log / outbox
+
+Revision ID: e41a9c3f7d62
+Revises: c27d5e8f4b13
+Create Date: 2025-01-24 10:12:51.204318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41a9c3f7d62'
+down_revision: Union[str, None] = 'c27d5e8f4b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade():
+    # AUTOINCREMENT so pruned sequence numbers are never handed out again
+    op.create_table(
+        'book_changes',
+        sa.Column('seq', sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column('type', sa.String, nullable=False),
+        sa.Column('book_id', sa.Integer, nullable=True),
+        sa.Column('data', sa.JSON, nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.Column('published', sa.Boolean, nullable=False, server_default='0'),
+        sqlite_autoincrement=True,
+    )
+    op.create_index('ix_book_changes_pending', 'book_changes', ['seq'], sqlite_where=sa.text('published = 0'))
+
+def downgrade():
+    op.drop_index('ix_book_changes_pending', table_name='book_changes')
+    op.drop_table('book_changes')
@@ -2,14 +2,26 @@ from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import  HTTPException
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from decouple import config
 import secrets
+import time
 
-# can be place in a .env file
-SECRET_KEY = secrets.token_hex(32)  # Generating a 64-character hexadecimal string
+from app.metrics import jwt_decode_duration
+
+# can be place in a .env file; must be shared by every worker/replica,
+# otherwise a random per-process key is generated
+SECRET_KEY = config("SECRET_KEY", default=secrets.token_hex(32))  # Generating a 64-character hexadecimal string
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Verified tokens are cached until they expire, so repeat requests skip jwt.decode
+TOKEN_CACHE_SIZE = config("AUTH_TOKEN_CACHE_SIZE", default=10_000, cast=int)
+# Upper bound for tokens without an exp claim
+TOKEN_CACHE_MAX_TTL = 300
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+_token_cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -18,8 +30,26 @@ def create_access_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def verify_token(token: str):
+    now = time.time()
+    cached = _token_cache.get(token)
+    if cached is not None:
+        expires, subject = cached
+        if expires > now:
+            _token_cache.move_to_end(token)
+            return subject
+        del _token_cache[token]
+
+    start = time.perf_counter()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    finally:
+        jwt_decode_duration.observe(time.perf_counter() - start)
+
+    subject = payload.get("sub")
+    expires = payload.get("exp", now + TOKEN_CACHE_MAX_TTL)
+    _token_cache[token] = (expires, subject)
+    if len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return subject
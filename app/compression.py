@@ -0,0 +1,143 @@
+# app/compression.py
+import zlib
+from collections import Counter
+
+from decouple import config
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without the brotli package only gzip is offered
+    brotli = None
+
+COMPRESSION_ENABLED = config("COMPRESSION_ENABLED", default=True, cast=bool)
+COMPRESSION_MIN_SIZE = config("COMPRESSION_MIN_SIZE", default=1024, cast=int)
+GZIP_LEVEL = config("GZIP_LEVEL", default=6, cast=int)
+BROTLI_LEVEL = config("BROTLI_LEVEL", default=4, cast=int)
+
+# Bodies worth compressing; SSE is left alone so every event is flushed as is
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/csv", "text/html", "text/plain"}
+
+# Per encoding, for /metrics
+compressed_responses = Counter()
+bytes_in = Counter()
+bytes_out = Counter()
+
+
+class GzipEncoder:
+    def __init__(self, level: int = GZIP_LEVEL):
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        # Sync flushes let a streamed chunk be decoded as soon as it arrives
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliEncoder:
+    def __init__(self, level: int = BROTLI_LEVEL):
+        self._brotli = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self._brotli.process(data) + (self._brotli.finish() if final else self._brotli.flush())
+
+
+# In order of preference when the client weighs them equally
+ENCODERS = {"br": BrotliEncoder} if brotli is not None else {}
+ENCODERS["gzip"] = GzipEncoder
+
+
+def negotiate(accept_encoding: str, encoders=ENCODERS) -> str | None:
+    """The encoding with the highest q-value the client accepts, if any."""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.strip()] = q
+    best, best_q = None, 0.0
+    for coding in encoders:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").partition(";")[0].strip()
+    return content_type in COMPRESSIBLE_TYPES and "content-encoding" not in headers
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware compressing text responses with gzip or brotli.
+
+    Whole bodies smaller than minimum_size go out as they are; streamed
+    bodies (exports) are compressed chunk by chunk whatever their size.
+    A compressed response's ETag is marked weak (W/): the handler's strong
+    tag names the uncompressed bytes, and two representations must not
+    share one strong validator. If-None-Match compares weakly, so 304s
+    still work.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, gzip_level: int = GZIP_LEVEL,
+                 brotli_level: int = BROTLI_LEVEL, enabled: bool = COMPRESSION_ENABLED):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_level}
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            return await self.app(scope, receive, send)
+        encoding = None
+        if scope["method"] != "HEAD":
+            encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        held = None
+        encoder = None
+
+        async def send_wrapper(message):
+            nonlocal held, encoder
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                if not compressible(headers):
+                    return await send(message)
+                headers.add_vary_header("Accept-Encoding")
+                if encoding is None:
+                    return await send(message)
+                # Wait for the first body chunk to know the size
+                held = message
+                return
+            if message["type"] != "http.response.body" or (held is None and encoder is None):
+                return await send(message)
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if held is not None:
+                start, held = held, None
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    return await send(message)
+                encoder = ENCODERS[encoding](self.levels[encoding])
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                del headers["Content-Length"]
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                compressed = encoder.compress(body, final=not more_body)
+                if not more_body:
+                    headers["Content-Length"] = str(len(compressed))
+                compressed_responses[encoding] += 1
+                await send(start)
+            else:
+                compressed = encoder.compress(body, final=not more_body)
+            bytes_in[encoding] += len(body)
+            bytes_out[encoding] += len(compressed)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,74 +1,486 @@
-from sqlalchemy.orm import Session
-from app import models, schemas
-from app.utils import hash_password
-from app.events import event_manager
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import bindparam, delete, func, insert, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas, stats
+from app.utils import hash_password_async
+from app.cache import book_cache, BOOK_CACHE_MAX_ROWS
+from app.outbox import outbox
 
 # User-related operations
-def get_user(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).filter(models.User.username == username))
+    return result.scalars().first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = hash_password(user.password)
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await hash_password_async(user.password)
     db_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 # Book-related operations
-def get_books(db: Session, skip: int, limit: int):
-    return db.query(models.Book).offset(skip).limit(limit).all()
+BOOK_SORT_COLUMNS = {
+    "id": models.Book.id,
+    "title": models.Book.title,
+    "author": models.Book.author,
+    "genre": models.Book.genre,
+    "published_date": models.Book.published_date,
+}
 
-def get_book(db: Session, book_id: int):
-    return db.query(models.Book).filter(models.Book.id == book_id).first()
+def filter_books(query, filters: schemas.BookQuery | None):
+    # Every filter is served by one of the composite indexes on models.Book
+    if filters is None:
+        return query
+    if filters.author is not None:
+        query = query.filter(models.Book.author == filters.author)
+    if filters.genre is not None:
+        query = query.filter(models.Book.genre == filters.genre)
+    if filters.published_from is not None:
+        query = query.filter(models.Book.published_date >= filters.published_from)
+    if filters.published_to is not None:
+        query = query.filter(models.Book.published_date <= filters.published_to)
+    return query
 
-async def create_book(db: Session, book: schemas.BookCreate):
+def books_query(skip: int, limit: int, filters: schemas.BookQuery | None = None):
+    query = filter_books(select(models.Book), filters)
+    if filters is not None and filters.sort:
+        column = BOOK_SORT_COLUMNS[filters.sort.lstrip("-")]
+        if filters.sort.startswith("-"):
+            query = query.order_by(column.desc(), models.Book.id.desc())
+        else:
+            query = query.order_by(column, models.Book.id)
+    return query.offset(skip).limit(limit)
+
+def books_after_query(after: tuple | None, limit: int, order: str = "id", filters: schemas.BookQuery | None = None):
+    # Keyset pagination: seek past the last seen key instead of scanning skipped rows.
+    # Fetches one extra row to tell whether another page follows.
+    query = filter_books(select(models.Book), filters)
+    if order == "title":
+        if after is not None:
+            query = query.filter(tuple_(models.Book.title, models.Book.id) > tuple_(*after))
+        query = query.order_by(models.Book.title, models.Book.id)
+    else:
+        if after is not None:
+            query = query.filter(models.Book.id > after[0])
+        query = query.order_by(models.Book.id)
+    return query.limit(limit + 1)
+
+# Fields of schemas.Book in response order. Listings select only the
+# requested ones as plain rows instead of ORM objects.
+BOOK_FIELDS = ("id", "title", "author", "published_date", "summary", "genre")
+# Compact default for list views: everything but the free-text summary
+LIST_FIELDS = ("id", "title", "author", "published_date", "genre")
+
+def book_rows(query, fields: tuple = LIST_FIELDS, order: str = "id"):
+    # Rows are (*fields, [title,] id, version). The trailing key columns feed
+    # list ETags and cursors; encoding zips fields only, so they are never sent.
+    keys = (models.Book.title,) if order == "title" else ()
+    columns = (getattr(models.Book, name) for name in fields)
+    return query.with_only_columns(*columns, *keys, models.Book.id, models.Book.version)
+
+# Exports default to every column, version and updated_at included
+EXPORT_FIELDS = tuple(column.name for column in models.Book.__table__.columns)
+
+def row_version(row) -> tuple:
+    # (id, version) of a book_rows() row
+    return row[-2], row[-1]
+
+async def get_books(db: AsyncSession, skip: int, limit: int, filters: schemas.BookQuery | None = None,
+                    fields: tuple = LIST_FIELDS):
+    result = await db.execute(book_rows(books_query(skip, limit, filters), fields))
+    return result.all()
+
+async def get_books_after(db: AsyncSession, after: tuple | None, limit: int, order: str = "id",
+                          filters: schemas.BookQuery | None = None, fields: tuple = LIST_FIELDS):
+    # Returns the page plus the key of its last row when more rows follow.
+    result = await db.execute(book_rows(books_after_query(after, limit, order, filters), fields, order))
+    books = result.all()
+    if not books or len(books) <= limit:
+        return books, None
+    books = books[:limit]
+    last = books[-1]
+    next_key = (last[-3], last[-2]) if order == "title" else (last[-2],)
+    return books, next_key
+
+def use_cache(db: AsyncSession):
+    # Read-your-writes sessions skip the cache: another worker's write may
+    # not have invalidated it yet
+    return not db.info.get("read_your_writes")
+
+async def get_books_cached(db: AsyncSession, skip: int, limit: int, filters: schemas.BookQuery | None = None,
+                           fields: tuple = LIST_FIELDS):
+    # Read-through cache for the first pages; returns rows as plain tuples
+    if not use_cache(db) or limit > BOOK_CACHE_MAX_ROWS:
+        return [tuple(row) for row in await get_books(db, skip, limit, filters, fields)]
+    key = ("books", skip, limit, filters.model_dump_json() if filters else None, fields)
+    books = book_cache.get(key)
+    if books is None:
+        generation = book_cache.generation
+        books = [tuple(row) for row in await get_books(db, skip, limit, filters, fields)]
+        book_cache.set(key, books, generation)
+    return books
+
+async def get_books_versions(db: AsyncSession, query):
+    # (id, version) pairs for the rows a listing query would return, for list ETags
+    result = await db.execute(query.with_only_columns(models.Book.id, models.Book.version))
+    return result.all()
+
+async def explain_query(db: AsyncSession, query):
+    # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail)
+    compiled = query.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+    result = await db.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+    return str(compiled), [row[3] for row in result]
+
+# BM25 column weights: title, author, summary, genre
+SEARCH_SQL = text("""
+    SELECT b.id, b.title, b.author, b.published_date, b.summary, b.genre,
+           bm25(books_fts, 10.0, 5.0, 1.0, 2.0) AS score,
+           snippet(books_fts, -1, '<mark>', '</mark>', '…', 16) AS snippet
+    FROM books_fts
+    JOIN books AS b ON b.id = books_fts.rowid
+    WHERE books_fts MATCH :query
+    ORDER BY score
+    LIMIT :limit OFFSET :skip
+""")
+
+SEARCH_FIELDS = (*BOOK_FIELDS, "score", "snippet")
+
+async def search_books(db: AsyncSession, query: str, skip: int, limit: int):
+    # Rows of SEARCH_FIELDS; lower BM25 scores rank better
+    result = await db.execute(SEARCH_SQL, {"query": query, "limit": limit, "skip": skip})
+    return result.all()
+
+async def get_book(db: AsyncSession, book_id: int):
+    return await db.get(models.Book, book_id)
+
+async def get_book_version(db: AsyncSession, book_id: int):
+    # Cheap lookup for conditional requests: no full row is loaded
+    cached = book_cache.get(("book", book_id)) if use_cache(db) else None
+    if cached is not None:
+        return cached["version"], cached["updated_at"]
+    result = await db.execute(
+        select(models.Book.version, models.Book.updated_at).filter(models.Book.id == book_id)
+    )
+    return result.first()
+
+def book_as_dict(book: models.Book):
+    return {column.name: getattr(book, column.name) for column in models.Book.__table__.columns}
+
+async def get_book_cached(db: AsyncSession, book_id: int):
+    # Read-through cache; returns a plain dict or None
+    key = ("book", book_id)
+    book = book_cache.get(key) if use_cache(db) else None
+    if book is None:
+        generation = book_cache.generation
+        db_book = await get_book(db, book_id)
+        if db_book is None:
+            return None
+        book = book_as_dict(db_book)
+        book_cache.set(key, book, generation)
+    return book
+
+# Change log
+def record_change(db: AsyncSession, change_type: str, data: dict, book_id: int | None = None):
+    # Added to the caller's transaction, so the change and its event commit together
+    change = models.BookChange(type=change_type, book_id=book_id, data=data)
+    db.add(change)
+    return change
+
+async def get_changes(db: AsyncSession, since: int, limit: int):
+    # Fetches one extra row to tell whether more changes follow
+    result = await db.execute(
+        select(models.BookChange)
+        .filter(models.BookChange.seq > since)
+        .order_by(models.BookChange.seq)
+        .limit(limit + 1)
+    )
+    changes = result.scalars().all()
+    return changes[:limit], len(changes) > limit
+
+async def has_change(db: AsyncSession, seq: int):
+    # Whether this session's database already has change `seq`, e.g. a lagging replica
+    result = await db.execute(select(func.max(models.BookChange.seq)))
+    return (result.scalar() or 0) >= seq
+
+async def get_change_bounds(db: AsyncSession):
+    # (oldest retained seq, newest seq), both None while the log is empty
+    result = await db.execute(select(func.min(models.BookChange.seq), func.max(models.BookChange.seq)))
+    return result.one()
+
+async def create_book(db: AsyncSession, book: schemas.BookCreate):
     db_book = models.Book(**book.dict())
     db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
-    
-    # Emit book created event
-    await event_manager.emit("book_created", {
+    await db.flush()
+    change = record_change(db, "book_created", {
         "id": db_book.id,
         "title": db_book.title,
         "author": db_book.author,
         "genre": db_book.genre
-    })
+    }, db_book.id)
+    await stats.adjust(db, stats.book_deltas(change.data))
+    await db.commit()
+    
+    # Publish book created event right after commit so cache hooks run before any other read
+    await outbox.publish(db, [change])
+    await db.refresh(db_book)
     return db_book
 
-async def update_book(db: Session, book_id: int, book: schemas.BookCreate):
-    db_book = get_book(db, book_id)
+class VersionConflict(Exception):
+    """The stored book version did not match the If-Match precondition."""
+
+async def update_book(db: AsyncSession, book_id: int, book: schemas.BookCreate,
+                      expected_versions: set[int] | None = None):
+    # The previous genre and author, to move the book between stats buckets
+    old = (await db.execute(
+        select(models.Book.genre, models.Book.author).filter(models.Book.id == book_id).with_for_update()
+    )).mappings().first()
+    if old is None:
+        await db.rollback()
+        return None
+    # Single conditional UPDATE ... RETURNING: the version check and bump are
+    # atomic, so concurrent If-Match writers cannot overwrite each other.
+    values = {key: value for key, value in book.dict().items() if value is not None}
+    values["version"] = models.Book.version + 1
+    values["updated_at"] = datetime.utcnow()
+    query = update(models.Book.__table__).where(models.Book.id == book_id)
+    if expected_versions is not None:
+        query = query.where(models.Book.version.in_(expected_versions))
+    result = await db.execute(query.values(**values).returning(*models.Book.__table__.columns))
+    db_book = result.mappings().first()
     if not db_book:
+        await db.rollback()
+        if expected_versions is not None and await get_book_version(db, book_id) is not None:
+            raise VersionConflict()
         return None
-        
-    for key, value in book.dict().items():
-        if value is not None:
-            setattr(db_book, key, value)
-    db.commit()
-    db.refresh(db_book)
+    change = record_change(db, "book_updated", {
+        "id": db_book["id"],
+        "title": db_book["title"],
+        "author": db_book["author"],
+        "genre": db_book["genre"]
+    }, book_id)
+    await stats.adjust(db, stats.book_deltas(db_book, 1, stats.book_deltas(old, -1)))
+    await db.commit()
     
-    # Emit book updated event
-    await event_manager.emit("book_updated", {
-        "id": db_book.id,
-        "title": db_book.title,
-        "author": db_book.author,
-        "genre": db_book.genre
-    })
-    return db_book
+    # Publish book updated event right after commit so cache hooks run before any other read
+    await outbox.publish(db, [change])
+    return dict(db_book)
 
-async def delete_book(db: Session, book_id: int):
-    db_book = get_book(db, book_id)
+async def delete_book(db: AsyncSession, book_id: int):
+    db_book = await get_book(db, book_id)
     if db_book:
-        # Store book info before deletion
+        # Store book info before deletion; author and genre let filtered SSE subscribers match it
         book_info = {
             "id": db_book.id,
-            "title": db_book.title
+            "title": db_book.title,
+            "author": db_book.author,
+            "genre": db_book.genre
         }
-        db.delete(db_book)
-        db.commit()
+        await db.delete(db_book)
+        change = record_change(db, "book_deleted", book_info, book_id)
+        await stats.adjust(db, stats.book_deltas(book_info, -1))
+        await db.commit()
         
-        # Emit book deleted event
-        await event_manager.emit("book_deleted", book_info)
+        # Publish book deleted event
+        await outbox.publish(db, [change])
         return True
-    return False
\ No newline at end of file
+    return False
+
+# Bulk operations
+BULK_BATCH_SIZE = 500
+
+async def bulk_create_books(db: AsyncSession, rows: list[tuple[int, schemas.BookCreate]]):
+    """Insert one batch in a single transaction and emit one aggregated event.
+
+    Returns (inserted ids, [(row number, error)]). If the batch insert fails,
+    rows are retried one at a time so a single bad row only fails itself.
+    """
+    if not rows:
+        return [], []
+    values = [book.dict() for _, book in rows]
+    errors = []
+    try:
+        result = await db.execute(insert(models.Book).returning(models.Book.id), values)
+        ids = list(result.scalars())
+        # One change and one event for the whole batch
+        changes = [record_change(db, "books_created", {
+            "count": len(ids),
+            "ids": ids,
+            "genres": sorted({value["genre"] for value in values}),
+            "authors": sorted({value["author"] for value in values})
+        })]
+        deltas = Counter()
+        for value in values:
+            stats.book_deltas(value, 1, deltas)
+        await stats.adjust(db, deltas)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        ids = []
+        changes = []
+        for (row_no, _), value in zip(rows, values):
+            try:
+                result = await db.execute(insert(models.Book).returning(models.Book.id), value)
+                book_id = result.scalar_one()
+                change = record_change(db, "book_created", {
+                    "id": book_id,
+                    "title": value["title"],
+                    "author": value["author"],
+                    "genre": value["genre"]
+                }, book_id)
+                await stats.adjust(db, stats.book_deltas(value))
+                await db.commit()
+                ids.append(book_id)
+                changes.append(change)
+            except Exception as e:
+                await db.rollback()
+                errors.append((row_no, str(e.__cause__ or e)))
+
+    if changes:
+        await outbox.publish(db, changes)
+    return ids, errors
+
+def change_data(book: dict) -> dict:
+    # Payload of single-book changes and events; author and genre let filtered SSE subscribers match it
+    return {"id": book["id"], "title": book["title"], "author": book["author"], "genre": book["genre"]}
+
+class BatchConflict(Exception):
+    """A book changed between reading and writing a batch; nothing was applied."""
+
+async def get_books_by_ids(db: AsyncSession, ids) -> dict[int, dict]:
+    # One WHERE id IN (...) lookup; FOR UPDATE locks the rows where the database supports it
+    if not ids:
+        return {}
+    result = await db.execute(
+        select(*models.Book.__table__.columns).where(models.Book.id.in_(ids)).with_for_update()
+    )
+    return {row["id"]: dict(row) for row in result.mappings()}
+
+async def insert_books(db: AsyncSession, values: list[dict]) -> list[int]:
+    # Multi-row INSERT ... RETURNING; ids come back in the order of values
+    result = await db.execute(
+        insert(models.Book).returning(models.Book.id, sort_by_parameter_order=True), values
+    )
+    return list(result.scalars())
+
+async def update_books(db: AsyncSession, books: list[dict], read_versions: dict[int, int]):
+    # Full rows written by one executemany UPDATE, each guarded by the version
+    # it was read at; a row changed by another writer fails the whole batch
+    params = [
+        {**{key: book[key] for key in BOOK_FIELDS[1:]}, "version": book["version"], "updated_at": book["updated_at"],
+         "b_id": book["id"], "b_version": read_versions[book["id"]]}
+        for book in books
+    ]
+    query = update(models.Book.__table__).where(
+        models.Book.id == bindparam("b_id"), models.Book.version == bindparam("b_version")
+    )
+    dialect = db.bind.dialect
+    if dialect.supports_sane_multi_rowcount:
+        result = await db.execute(query, params)
+        if result.rowcount != len(books):
+            raise BatchConflict()
+        return
+    # asyncpg and aiomysql do not report an executemany's row count, so
+    # check each row: by the ids it returns, or its own row count
+    updated = 0
+    for row in params:
+        if dialect.update_returning:
+            updated += (await db.execute(query.returning(models.Book.id), row)).scalar() == row["b_id"]
+        else:
+            updated += (await db.execute(query, row)).rowcount
+    if updated != len(books):
+        raise BatchConflict()
+
+async def delete_books(db: AsyncSession, ids: list[int]):
+    await db.execute(delete(models.Book.__table__).where(models.Book.id.in_(ids)))
+
+async def apply_batch(db: AsyncSession, operations: list[schemas.BatchOperation], atomic: bool = False):
+    """Apply creates, updates and deletes in one transaction.
+
+    Books named by updates and deletes are read with a single WHERE id IN
+    (...) and the operations are resolved against that snapshot in order, so
+    each book is written once however many operations touch it. Returns one
+    result per operation; failed operations (unknown id, version mismatch)
+    are skipped, or with atomic nothing is written at all. Events follow the
+    commit, one per applied operation.
+    """
+    original = await get_books_by_ids(db, {op.id for op in operations if op.op != "create"})
+    books = {book_id: dict(book) for book_id, book in original.items()}
+    now = datetime.utcnow()
+    results = []
+    creates = []
+    # (change type, result, book state after the operation) in operation order
+    applied = []
+    for index, op in enumerate(operations):
+        result = {"index": index, "op": op.op, "id": op.id}
+        results.append(result)
+        if op.op == "create":
+            values = op.book.model_dump()
+            creates.append(values)
+            result.update(status=201, version=1)
+            applied.append(("book_created", result, values))
+            continue
+        book = books.get(op.id)
+        if book is None:
+            result.update(status=404, error="Book not found")
+            continue
+        if op.version is not None and op.version != book["version"]:
+            result.update(status=412, error=f"Book is at version {book['version']}")
+            continue
+        if op.op == "update":
+            book.update({key: value for key, value in op.book.model_dump().items() if value is not None})
+            book.update(version=book["version"] + 1, updated_at=now)
+            result.update(status=200, version=book["version"])
+            applied.append(("book_updated", result, dict(book)))
+        else:
+            del books[op.id]
+            result.update(status=200)
+            applied.append(("book_deleted", result, book))
+
+    if atomic and len(applied) < len(operations):
+        await db.rollback()
+        return results, False
+    deleted = [book_id for book_id in original if book_id not in books]
+    updated = [book for book_id, book in books.items() if book["version"] != original[book_id]["version"]]
+    # Net effect on the stats: original rows out, final rows in
+    deltas = Counter()
+    for values in creates:
+        stats.book_deltas(values, 1, deltas)
+    for book_id in deleted:
+        stats.book_deltas(original[book_id], -1, deltas)
+    for book in updated:
+        stats.book_deltas(original[book["id"]], -1, deltas)
+        stats.book_deltas(book, 1, deltas)
+    try:
+        # Inserts go first: SQLite hands out max(id) + 1, so inserting after
+        # the deletes could reuse an id the same batch refers to
+        created_ids = iter(await insert_books(db, creates) if creates else [])
+        if updated:
+            await update_books(db, updated, {book_id: book["version"] for book_id, book in original.items()})
+        if deleted:
+            await delete_books(db, deleted)
+        changes = []
+        for change_type, result, book in applied:
+            if change_type == "book_created":
+                book["id"] = result["id"] = next(created_ids)
+            changes.append(record_change(db, change_type, change_data(book), book["id"]))
+        await stats.adjust(db, deltas)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    if changes:
+        await outbox.publish(db, changes)
+    return results, True
+
+async def stream_books(db: AsyncSession, fields: tuple = EXPORT_FIELDS, batch_size: int = BULK_BATCH_SIZE):
+    # Server-side cursor: rows are fetched batch_size at a time, never all at once,
+    # and plain rows skip the ORM identity map.
+    columns = models.Book.__table__.columns
+    result = await db.stream(
+        select(*(columns[name] for name in fields)).order_by(models.Book.id).execution_options(yield_per=batch_size)
+    )
+    async for partition in result.mappings().partitions():
+        yield partition
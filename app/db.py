@@ -1,9 +1,127 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
+from decouple import config
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./books.db"
+# Any SQLAlchemy URL; the async URL is derived from it unless set explicitly
+SQLALCHEMY_DATABASE_URL = config("DATABASE_URL", default="sqlite:///./books.db")
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None or "+" in parsed.drivername:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+ASYNC_SQLALCHEMY_DATABASE_URL = config("ASYNC_DATABASE_URL", default=async_url(SQLALCHEMY_DATABASE_URL))
+IS_SQLITE = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite"
+
+# "tuned" applies the pragmas below on every connection; "default" leaves
+# SQLite as it comes (rollback journal, no writer queue), for comparison
+SQLITE_PROFILE = config("SQLITE_PROFILE", default="tuned")
+SQLITE_PRAGMAS = {
+    # Readers never block the writer and vice versa
+    "journal_mode": config("SQLITE_JOURNAL_MODE", default="WAL"),
+    # NORMAL is durable in WAL mode except for the last commits on power loss
+    "synchronous": config("SQLITE_SYNCHRONOUS", default="NORMAL"),
+    # Negative values are KiB: 64 MiB page cache per connection
+    "cache_size": config("SQLITE_CACHE_SIZE", default=-64000, cast=int),
+    "mmap_size": config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int),
+    # Milliseconds a connection waits for a lock before "database is locked"
+    "busy_timeout": config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int),
+    "temp_store": "MEMORY",
+}
+
+# Connections kept per process for reads; overflow connections are closed when returned
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=5, cast=int)
+# Seconds a write waits for its turn in the writer queue
+DB_WRITE_TIMEOUT = config("DB_WRITE_TIMEOUT", default=30.0, cast=float)
+
+# Read-only connections cannot change the journal mode; query_only guards
+# against writes slipping through a read session
+SQLITE_READ_PRAGMAS = {
+    **{name: value for name, value in SQLITE_PRAGMAS.items() if name != "journal_mode"},
+    "query_only": 1,
+}
+
+def sqlite_pragmas(pragmas: dict):
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return set_sqlite_pragmas
+
+def read_only_url(url: str) -> str:
+    # A SQLite URI filename with mode=ro: the connection never takes the write lock
+    parsed = make_url(url)
+    return parsed.set(
+        database=f"file:{parsed.database}", query={**parsed.query, "mode": "ro", "uri": "true"}
+    ).render_as_string(hide_password=False)
+
+def engine_options(poolclass, pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW,
+                   timeout: float = 30.0) -> dict:
+    options = {}
+    if IS_SQLITE:
+        # Connections are handed between threads by the pool, never shared
+        options["connect_args"] = {"check_same_thread": False}
+        if SQLITE_PROFILE == "default":
+            return options
+    # Explicit pool: aiosqlite would otherwise open a new connection (and
+    # thread) per session, losing the page cache every time
+    options.update(poolclass=poolclass, pool_size=pool_size, max_overflow=max_overflow, pool_timeout=timeout)
+    return options
+
+def tune(sync_engine, pragmas: dict = SQLITE_PRAGMAS):
+    if IS_SQLITE and SQLITE_PROFILE == "tuned":
+        event.listen(sync_engine, "connect", sqlite_pragmas(pragmas))
+
+# Sync engine is kept for schema management (the startup migration check, alembic) and scripts
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(QueuePool))
+tune(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+
+# Request handlers use the async engine so commits never block the event loop
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **engine_options(AsyncAdaptedQueuePool))
+tune(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# SQLite allows one writer at a time. Funnelling writes through a single
+# pooled connection queues them in the pool instead of having concurrent
+# transactions spin on the file lock; reads keep the wider pool above.
+if IS_SQLITE and SQLITE_PROFILE == "tuned":
+    write_engine = create_async_engine(
+        ASYNC_SQLALCHEMY_DATABASE_URL, **engine_options(AsyncAdaptedQueuePool, pool_size=1, max_overflow=0, timeout=DB_WRITE_TIMEOUT)
+    )
+    tune(write_engine.sync_engine)
+else:
+    write_engine = async_engine
+WriteSessionLocal = async_sessionmaker(
+    bind=write_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Reads that can tolerate replica lag go to READ_DATABASE_URL when set (e.g. a
+# Postgres replica). On SQLite they use read-only connections to the same
+# file, which in WAL mode always see the latest commit and never wait for
+# the writer.
+READ_DATABASE_URL = config("READ_DATABASE_URL", default=None)
+if READ_DATABASE_URL:
+    read_engine = create_async_engine(async_url(READ_DATABASE_URL), **engine_options(AsyncAdaptedQueuePool))
+elif IS_SQLITE and SQLITE_PROFILE == "tuned":
+    read_engine = create_async_engine(read_only_url(ASYNC_SQLALCHEMY_DATABASE_URL), **engine_options(AsyncAdaptedQueuePool))
+    tune(read_engine.sync_engine, SQLITE_READ_PRAGMAS)
+else:
+    read_engine = async_engine
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
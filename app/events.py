@@ -1,34 +1,541 @@
 # app/events.py
-from asyncio import Queue
-from typing import Dict
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
 from datetime import datetime
 
+import aiosqlite
+from decouple import config
+
+from app.metrics import event_emit_duration
+
+OVERFLOW_POLICIES = ("drop_oldest", "disconnect", "coalesce")
+
+# Per-subscriber buffer size and what to do when a slow consumer fills it
+SSE_BUFFER_SIZE = config("SSE_BUFFER_SIZE", default=256, cast=int)
+SSE_OVERFLOW_POLICY = config("SSE_OVERFLOW_POLICY", default="drop_oldest")
+# Comment lines sent on idle streams so proxies do not time them out (0 = off)
+SSE_KEEPALIVE_SECONDS = config("SSE_KEEPALIVE_SECONDS", default=15.0, cast=float)
+# Events arriving within this window go out as one write (0 = as they come)
+SSE_COALESCE_MS = config("SSE_COALESCE_MS", default=0.0, cast=float)
+
+# "local" delivers within this process only; "sqlite" shares events between
+# every worker/replica that can open EVENT_BUS_PATH
+EVENT_BACKEND = config("EVENT_BACKEND", default="local")
+EVENT_BUS_PATH = config("EVENT_BUS_PATH", default="./events.db")
+EVENT_BUS_POLL_INTERVAL = config("EVENT_BUS_POLL_INTERVAL", default=0.05, cast=float)
+EVENT_BUS_RETENTION = config("EVENT_BUS_RETENTION", default=10_000, cast=int)
+# Recent events kept in memory by the local backend for Last-Event-ID replay
+EVENT_REPLAY_SIZE = config("EVENT_REPLAY_SIZE", default=1_000, cast=int)
+
+# Identifies events published by this process
+ORIGIN = uuid.uuid4().hex
+
+
+def format_sse(event: dict, event_id: Optional[str] = None) -> bytes:
+    # The id field is what browsers send back as Last-Event-ID on reconnect
+    prefix = f"id: {event_id}\n" if event_id else ""
+    return f"{prefix}data: {json.dumps(event)}\n\n".encode()
+
+
+def event_keys(event: dict) -> tuple[set, set, set]:
+    """Book ids, genres and authors an event is about, for filter matching.
+
+    Single-book events carry id/genre/author; books_created carries ids plus
+    the genres and authors of the batch.
+    """
+    data = event["data"]
+    ids = set(data["ids"]) if "ids" in data else {data["id"]} if "id" in data else set()
+    genres = set(data["genres"]) if "genres" in data else {data["genre"]} if "genre" in data else set()
+    authors = set(data["authors"]) if "authors" in data else {data["author"]} if "author" in data else set()
+    return ids, genres, authors
+
+
+class EventFilter:
+    """What a subscriber wants to receive; an empty field matches anything.
+
+    Fields combine with AND, values within a field with OR.
+    """
+
+    def __init__(self, types: Iterable[str] = (), genres: Iterable[str] = (),
+                 authors: Iterable[str] = (), book_ids: Iterable[int] = ()):
+        self.types = frozenset(types)
+        self.genres = frozenset(genres)
+        self.authors = frozenset(authors)
+        self.book_ids = frozenset(book_ids)
+
+    def __bool__(self):
+        return bool(self.types or self.genres or self.authors or self.book_ids)
+
+    def index_keys(self) -> list[tuple[str, Hashable]]:
+        # A subscriber is indexed under its most selective field only;
+        # matches() checks the rest
+        if self.book_ids:
+            return [("id", book_id) for book_id in self.book_ids]
+        if self.authors:
+            return [("author", author) for author in self.authors]
+        if self.genres:
+            return [("genre", genre) for genre in self.genres]
+        if self.types:
+            return [("type", event_type) for event_type in self.types]
+        return [ALL_EVENTS]
+
+    def matches(self, event_type: str, keys: tuple[set, set, set]) -> bool:
+        ids, genres, authors = keys
+        if self.types and event_type not in self.types:
+            return False
+        if self.book_ids and self.book_ids.isdisjoint(ids):
+            return False
+        if self.genres and self.genres.isdisjoint(genres):
+            return False
+        if self.authors and self.authors.isdisjoint(authors):
+            return False
+        return True
+
+    def describe(self) -> dict:
+        return {
+            "types": sorted(self.types),
+            "genres": sorted(self.genres),
+            "authors": sorted(self.authors),
+            "book_ids": sorted(self.book_ids),
+        }
+
+
+# Index key for subscribers without filters
+ALL_EVENTS = ("all", None)
+
+
+class Subscriber:
+    """Bounded event buffer for one SSE client.
+
+    push() never blocks. When the buffer is full the overflow policy decides:
+    drop_oldest discards the oldest event, disconnect closes the subscriber,
+    coalesce replaces a queued event about the same book (falling back to
+    drop_oldest when there is none).
+
+    Buffered entries hold the event and its encoded SSE message, which is
+    shared with every other subscriber that received the same event.
+    """
+
+    def __init__(self, subscriber_id: int, max_size: int, policy: str,
+                 event_filter: Optional[EventFilter] = None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.id = subscriber_id
+        self.max_size = max_size
+        self.policy = policy
+        self.filter = event_filter or EventFilter()
+        self.buffer: deque = deque()
+        self.closed = False
+        self._ready = asyncio.Event()
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def push(self, event: dict, message: bytes, now: float):
+        if self.closed:
+            return
+        if len(self.buffer) >= self.max_size:
+            if self.policy == "disconnect":
+                self.dropped += len(self.buffer) + 1
+                self.close()
+                return
+            if self.policy != "coalesce" or not self._coalesce(event):
+                self.buffer.popleft()
+                self.dropped += 1
+        self.buffer.append((now, event, message))
+        self.max_depth = max(self.max_depth, len(self.buffer))
+        self._ready.set()
+
+    def _coalesce(self, event: dict) -> bool:
+        # Drop an older queued event for the same book; the new one supersedes it
+        book_id = event["data"].get("id")
+        if book_id is None:
+            return False
+        for index, (_, queued, _) in enumerate(self.buffer):
+            if queued["data"].get("id") == book_id:
+                del self.buffer[index]
+                self.coalesced += 1
+                return True
+        return False
+
+    async def _next(self) -> Optional[tuple]:
+        # Returns None once the subscriber has been closed
+        while not self.buffer:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        self.delivered += 1
+        return self.buffer.popleft()
+
+    async def get(self) -> Optional[dict]:
+        entry = await self._next()
+        return entry and entry[1]
+
+    async def get_messages(self, timeout: Optional[float] = None, window: float = 0.0) -> Optional[List[bytes]]:
+        """Everything buffered, once there is something; [] after timeout
+        seconds without events, None once closed.
+
+        With a window, waits that long after the first event so the ones
+        right behind it are written out together.
+        """
+        while not self.buffer:
+            if self.closed:
+                return None
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        if window:
+            await asyncio.sleep(window)
+            if self.closed:
+                return None
+        messages = [message for _, _, message in self.buffer]
+        self.buffer.clear()
+        self.delivered += len(messages)
+        return messages
+
+    def close(self):
+        self.closed = True
+        self.buffer.clear()
+        self._ready.set()
+
+    def stats(self) -> dict:
+        lag = time.monotonic() - self.buffer[0][0] if self.buffer else 0.0
+        return {
+            "id": self.id,
+            "policy": self.policy,
+            "depth": len(self.buffer),
+            "max_depth": self.max_depth,
+            "lag_seconds": round(lag, 3),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "closed": self.closed,
+            "filter": self.filter.describe(),
+        }
+
+
+class LocalEventBus:
+    """In-process backend: events are numbered and delivered immediately.
+
+    Sequence numbers restart with the process, so the epoch is per process.
+    """
+
+    def __init__(self, replay_size: int = EVENT_REPLAY_SIZE):
+        self.seq = 0
+        self.dispatch = None
+        self.epoch = ORIGIN[:8]
+        self.recent: deque = deque(maxlen=replay_size)
+
+    async def start(self, dispatch):
+        self.dispatch = dispatch
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: dict):
+        self.seq += 1
+        self.dispatch(self.seq, event, True)
+        self.recent.append(event)
+
+    async def replay(self, after_seq: int) -> Optional[list]:
+        # Events after after_seq, or None when some of them were already evicted
+        if after_seq >= self.seq:
+            return []
+        if not self.recent or self.recent[0]["seq"] > after_seq + 1:
+            return None
+        return [event for event in self.recent if event["seq"] > after_seq]
+
+
+class SQLiteEventBus:
+    """Cross-process backend: an append-only events table in a shared SQLite file.
+
+    The AUTOINCREMENT key is the global sequence number, so every worker
+    delivers events in the same order. Workers poll PRAGMA data_version, which
+    only changes when another connection commits, and read new rows when it does.
+    """
+
+    def __init__(self, path: str, poll_interval: float, retention: int):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.dispatch = None
+        self.last_seq = 0
+        self._conn = None
+        self._lock = None
+        self._task = None
+        self._data_version = None
+        self.epoch = None
+
+    async def start(self, dispatch):
+        if self._conn is not None:
+            return
+        self.dispatch = dispatch
+        self._lock = asyncio.Lock()
+        conn = await aiosqlite.connect(self.path)
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        await conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " origin TEXT NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        # The epoch changes only if the shared log is recreated and seq restarts
+        await conn.execute("CREATE TABLE IF NOT EXISTS bus_meta (epoch TEXT NOT NULL)")
+        await conn.execute("INSERT INTO bus_meta (epoch) SELECT ? WHERE NOT EXISTS (SELECT 1 FROM bus_meta)", (ORIGIN[:8],))
+        await conn.commit()
+        async with conn.execute("SELECT epoch FROM bus_meta") as cursor:
+            self.epoch = (await cursor.fetchone())[0]
+        # Only deliver events published after this worker started
+        async with conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events") as cursor:
+            self.last_seq = (await cursor.fetchone())[0]
+        self._conn = conn
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def publish(self, event: dict):
+        cursor = await self._conn.execute(
+            "INSERT INTO events (origin, payload) VALUES (?, ?)", (ORIGIN, json.dumps(event))
+        )
+        seq = cursor.lastrowid
+        if seq % 1000 == 0:
+            await self._conn.execute("DELETE FROM events WHERE seq <= ?", (seq - self.retention,))
+        await self._conn.commit()
+        # Deliver locally right away instead of waiting for the next poll
+        await self._drain()
+
+    async def replay(self, after_seq: int) -> Optional[list]:
+        # Served from the shared log, so it works whichever worker the client reconnects to
+        async with self._conn.execute("SELECT MIN(seq), MAX(seq) FROM events") as cursor:
+            first, last = await cursor.fetchone()
+        if last is None or after_seq >= last:
+            return []
+        if first > after_seq + 1:
+            return None
+        async with self._conn.execute(
+            "SELECT seq, payload FROM events WHERE seq > ? AND seq <= ? ORDER BY seq", (after_seq, self.last_seq)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        events = []
+        for seq, payload in rows:
+            event = json.loads(payload)
+            event["seq"] = seq
+            events.append(event)
+        return events
+
+    async def _poll(self):
+        while True:
+            try:
+                async with self._conn.execute("PRAGMA data_version") as cursor:
+                    data_version = (await cursor.fetchone())[0]
+                if data_version != self._data_version:
+                    self._data_version = data_version
+                    await self._drain()
+            except Exception as e:
+                print(f"Error polling event bus: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _drain(self):
+        async with self._lock:
+            async with self._conn.execute(
+                "SELECT seq, origin, payload FROM events WHERE seq > ? ORDER BY seq", (self.last_seq,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            for seq, origin, payload in rows:
+                self.last_seq = seq
+                self.dispatch(seq, json.loads(payload), origin == ORIGIN)
+
+
+def create_event_bus(backend: str = EVENT_BACKEND):
+    if backend == "local":
+        return LocalEventBus()
+    if backend == "sqlite":
+        return SQLiteEventBus(EVENT_BUS_PATH, EVENT_BUS_POLL_INTERVAL, EVENT_BUS_RETENTION)
+    raise ValueError(f"Unknown event backend: {backend}")
+
+
 class EventManager:
-    def __init__(self):
-        self.listeners: Dict[int, Queue] = {}
+    def __init__(self, buffer_size: int = SSE_BUFFER_SIZE, overflow_policy: str = SSE_OVERFLOW_POLICY, bus=None):
+        self.bus = bus or create_event_bus()
+        self._started = False
+        self.listeners: Dict[int, Subscriber] = {}
+        # Index key -> subscribers, so dispatch only visits matching ones
+        self._index: Dict[tuple, Dict[int, Subscriber]] = {}
         self._counter = 0
-        self.event_queue = Queue()
+        self.buffer_size = buffer_size
+        self.overflow_policy = overflow_policy
+        # Subscribers closed by the disconnect policy
+        self.disconnected = 0
+        self.hooks: List[Callable[[str, dict], None]] = []
+
+    async def start(self):
+        # Idempotent; also called lazily so scripts work without the app lifespan
+        if not self._started:
+            self._started = True
+            await self.bus.start(self.dispatch)
 
-    async def register(self) -> tuple[int, Queue]:
+    async def stop(self):
+        if self._started:
+            self._started = False
+            await self.bus.stop()
+
+    async def register(self, buffer_size: Optional[int] = None, overflow_policy: Optional[str] = None,
+                       event_filter: Optional[EventFilter] = None) -> tuple[int, Subscriber]:
+        await self.start()
         self._counter += 1
-        queue = Queue()
-        self.listeners[self._counter] = queue
-        return self._counter, queue
+        subscriber = Subscriber(
+            self._counter,
+            buffer_size or self.buffer_size,
+            overflow_policy or self.overflow_policy,
+            event_filter,
+        )
+        self.listeners[self._counter] = subscriber
+        for key in subscriber.filter.index_keys():
+            self._index.setdefault(key, {})[self._counter] = subscriber
+        return self._counter, subscriber
 
     def deregister(self, listener_id: int):
-        self.listeners.pop(listener_id, None)
+        subscriber = self.listeners.pop(listener_id, None)
+        if subscriber is not None:
+            subscriber.close()
+            self._unindex(listener_id, subscriber)
+
+    def _unindex(self, listener_id: int, subscriber: Subscriber):
+        for key in subscriber.filter.index_keys():
+            bucket = self._index.get(key)
+            if bucket is not None:
+                bucket.pop(listener_id, None)
+                if not bucket:
+                    del self._index[key]
 
-    async def emit(self, event_type: str, book_data: dict):
+    async def subscribe_from(self, last_event_id: Optional[str],
+                             event_filter: Optional[EventFilter] = None) -> tuple[int, Subscriber, Optional[list]]:
+        """Register a subscriber and collect what it missed since last_event_id.
+
+        last_event_id is "<epoch>-<seq>" as sent in SSE id fields. Returns the
+        (event, message) pairs to replay first, filtered like live events, or
+        None when the client must resync because the events are gone or come
+        from another epoch.
+        """
+        listener_id, subscriber = await self.register(event_filter=event_filter)
+        if not last_event_id:
+            return listener_id, subscriber, []
+        epoch, _, seq = last_event_id.rpartition("-")
+        if epoch != self.bus.epoch or not seq.isdigit():
+            return listener_id, subscriber, None
+        replay = await self.bus.replay(int(seq))
+        if replay is None:
+            return listener_id, subscriber, None
+        # Anything dispatched while replay was being read is already buffered
+        live = {event["seq"] for _, event, _ in subscriber.buffer}
+        replay = [
+            (event, format_sse(event, self.event_id(event)))
+            for event in replay
+            if event["seq"] not in live and subscriber.filter.matches(event["type"], event_keys(event))
+        ]
+        return listener_id, subscriber, replay
+
+    def event_id(self, event: dict) -> str:
+        return f"{self.bus.epoch}-{event['seq']}"
+
+    def add_hook(self, hook: Callable[[str, dict], None]):
+        # Hooks run synchronously at the start of emit, before any listener is notified
+        self.hooks.append(hook)
+
+    async def emit(self, event_type: str, book_data: dict, change_seq: Optional[int] = None):
+        start = time.perf_counter()
+        # Local hooks run before publishing so this worker's caches are never stale
+        for hook in self.hooks:
+            hook(event_type, book_data)
         event = {
             "timestamp": datetime.utcnow().isoformat(),
             "type": event_type,
             "data": book_data
         }
-        # Add to event queue and notify all listeners
-        await self.event_queue.put(event)
-        if self.listeners:
-            for queue in self.listeners.values():
-                await queue.put(event)
+        if change_seq is not None:
+            # Position in the book_changes log, usable as GET /books/changes?since=
+            event["change_seq"] = change_seq
+        await self.start()
+        await self.bus.publish(event)
+        event_emit_duration.observe(time.perf_counter() - start)
+
+    def dispatch(self, seq: int, event: dict, local: bool):
+        # Called by the bus for every event, in sequence order
+        if not local:
+            for hook in self.hooks:
+                hook(event["type"], event["data"])
+        event["seq"] = seq
+        targets = self._targets(event)
+        if not targets:
+            return
+        # Serialized once; every recipient buffers the same bytes
+        message = format_sse(event, self.event_id(event))
+        # Non-blocking fan-out: a slow subscriber only ever affects its own buffer
+        closed = []
+        now = time.monotonic()
+        for bucket in targets:
+            for listener_id, subscriber in bucket.items():
+                subscriber.push(event, message, now)
+                if subscriber.closed:
+                    closed.append((listener_id, subscriber))
+        for listener_id, subscriber in closed:
+            if self.listeners.pop(listener_id, None) is not None:
+                self._unindex(listener_id, subscriber)
+        self.disconnected += len(closed)
+
+    def _targets(self, event: dict) -> list[Dict[int, Subscriber]]:
+        # Unfiltered subscribers are taken as is; the others come from the
+        # buckets this event's keys point at and are checked against their
+        # full filter, each at most once
+        event_type = event["type"]
+        targets = []
+        if ALL_EVENTS in self._index:
+            targets.append(self._index[ALL_EVENTS])
+        keys = event_keys(event)
+        ids, genres, authors = keys
+        lookups = [("type", event_type)]
+        lookups += [("genre", genre) for genre in genres]
+        lookups += [("author", author) for author in authors]
+        lookups += [("id", book_id) for book_id in ids]
+        matched = {}
+        for key in lookups:
+            for listener_id, subscriber in self._index.get(key, {}).items():
+                if listener_id not in matched and subscriber.filter.matches(event_type, keys):
+                    matched[listener_id] = subscriber
+        if matched:
+            targets.append(matched)
+        return targets
+
+    def stats(self, top: int = 20) -> dict:
+        # Totals plus the most lagging subscribers
+        subscribers = [subscriber.stats() for subscriber in self.listeners.values()]
+        subscribers.sort(key=lambda s: (s["depth"], s["lag_seconds"]), reverse=True)
+        return {
+            "listeners": len(subscribers),
+            "filtered": len(subscribers) - len(self._index.get(ALL_EVENTS, ())),
+            "index_keys": len(self._index),
+            "buffer_size": self.buffer_size,
+            "overflow_policy": self.overflow_policy,
+            "queued": sum(s["depth"] for s in subscribers),
+            "dropped": sum(s["dropped"] for s in subscribers),
+            "disconnected": self.disconnected,
+            "most_lagging": subscribers[:top],
+        }
 
 # Create a global event manager instance
-event_manager = EventManager()
\ No newline at end of file
+event_manager = EventManager()
@@ -1,25 +1,58 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import StreamingResponse
 import asyncio
-from datetime import datetime
+import csv
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import io
+import logging
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from fastapi.middleware.cors import CORSMiddleware
 import json
-from fastapi.responses import HTMLResponse 
+from typing import List, Literal, Optional, Union
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from pydantic import ValidationError
+from pydantic_core import to_json
+from sqlalchemy.exc import OperationalError
 
-from app import models, schemas, crud, auth, db, utils
-from app.events import event_manager
+from app import schemas, crud, auth, db, utils, metrics, profiling, stats, compression, migrations, ratelimit
+from app.cache import book_cache, BOOK_CACHE_MAX_SKIP
+from app.events import EventFilter, event_manager, format_sse, SSE_KEEPALIVE_SECONDS, SSE_COALESCE_MS
+from app.outbox import outbox
 
-models.Base.metadata.create_all(bind=db.engine)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Checks the schema against the newest Alembic revision (upgrading it
+    # unless SCHEMA_AUTO_UPGRADE is off), backfills book_stats on databases
+    # created before it existed, connects the event bus backend and starts
+    # its poller, if any, then the outbox relay that publishes book changes to it
+    await asyncio.to_thread(migrations.ensure, db.engine)
+    async with db.WriteSessionLocal() as session:
+        await stats.ensure(session)
+    await event_manager.start()
+    await outbox.start()
+    yield
+    await outbox.stop()
+    await event_manager.stop()
 
 app = FastAPI(
     title="Book Records API",
     description="CRUD operations for managing books, with JWT authentication and real-time updates.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
+# Per-client token buckets (429 + Retry-After); inside CORS, so browsers can
+# read the rejection and preflights are not counted
+app.add_middleware(ratelimit.RateLimitMiddleware)
+
 # Add CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,255 +60,574 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Change-Seq", "Retry-After"],
 )
 
+# gzip/brotli for JSON, NDJSON and CSV bodies over COMPRESSION_MIN_SIZE
+app.add_middleware(compression.CompressionMiddleware)
+
+# Opt-in request profiling; off until PROFILE_ENABLED or PUT /admin/profiling
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Request latency and per-request SQL counts; outermost, so CORS is timed too
+app.add_middleware(metrics.MetricsMiddleware)
+for engine in {db.engine, db.async_engine.sync_engine, db.write_engine.sync_engine, db.read_engine.sync_engine}:
+    metrics.instrument_engine(engine)
+    profiling.instrument_engine(engine)
+
+# Sampled from live state at scrape time only
+metrics.registry.register(metrics.Sampled(
+    "events_listeners", "Connected SSE subscribers.", lambda: len(event_manager.listeners)))
+metrics.registry.register(metrics.Sampled(
+    "events_queued", "Events buffered across all SSE subscribers.",
+    lambda: sum(len(s.buffer) for s in event_manager.listeners.values())))
+metrics.registry.register(metrics.Sampled(
+    "events_queue_depth_max", "Deepest SSE subscriber buffer.",
+    lambda: max((len(s.buffer) for s in event_manager.listeners.values()), default=0)))
+metrics.registry.register(metrics.Sampled(
+    "events_disconnected_total", "SSE subscribers closed for falling behind.",
+    lambda: event_manager.disconnected, kind="counter"))
+metrics.registry.register(metrics.Sampled(
+    "book_cache_requests_total", "Book read cache lookups.",
+    lambda: {"hit": book_cache.hits, "miss": book_cache.misses}, kind="counter", labelname="result"))
+metrics.registry.register(metrics.Sampled(
+    "http_compressed_responses_total", "Responses sent compressed.",
+    lambda: dict(compression.compressed_responses), kind="counter", labelname="encoding"))
+metrics.registry.register(metrics.Sampled(
+    "http_compression_input_bytes_total", "Body bytes before compression.",
+    lambda: dict(compression.bytes_in), kind="counter", labelname="encoding"))
+metrics.registry.register(metrics.Sampled(
+    "http_compression_output_bytes_total", "Body bytes sent after compression.",
+    lambda: dict(compression.bytes_out), kind="counter", labelname="encoding"))
+metrics.registry.register(metrics.Sampled(
+    "rate_limit_rejected_total", "Requests answered 429, by budget (streams: open stream cap).",
+    lambda: dict(ratelimit.rate_limiter.rejected), kind="counter", labelname="budget"))
+metrics.registry.register(metrics.Sampled(
+    "rate_limit_open_streams", "Open /stream/data connections counted against per-client caps.",
+    lambda: sum(ratelimit.rate_limiter.streams.values())))
+metrics.registry.register(metrics.Sampled(
+    "auth_password_pending", "bcrypt tasks running or queued.", utils.password_pending))
+metrics.registry.register(metrics.Sampled(
+    "outbox_published_total", "Book changes published to the event bus.",
+    lambda: outbox.published + outbox.recovered, kind="counter"))
+
+@app.exception_handler(utils.PasswordPoolBusy)
+async def password_pool_busy_handler(request: Request, exc: utils.PasswordPoolBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many concurrent password checks, retry shortly"},
+        headers={"Retry-After": "1"}
+    )
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Book Records App"}
 
 
 # Dependency to get DB session
-def get_db():
-    db_session = db.SessionLocal()  # Use a different name for the local variable
-    try:
+async def get_db():
+    async with db.AsyncSessionLocal() as db_session:  # Use a different name for the local variable
+        yield db_session
+
+# Dependency to get a session for writes, queued behind the single writer connection
+async def get_write_db():
+    async with db.WriteSessionLocal() as db_session:
+        yield db_session
+
+# Dependency to get a session on the read-only connections (or replica).
+# Send a write's X-Change-Seq back as X-Min-Change-Seq to read your own
+# writes: the read then falls back to the primary if the replica lags, and
+# skips the read cache.
+async def get_read_db(x_min_change_seq: Optional[int] = Header(None)):
+    db_session = db.ReadSessionLocal()
+    if x_min_change_seq is not None:
+        if not await crud.has_change(db_session, x_min_change_seq):
+            await db_session.close()
+            db_session = db.AsyncSessionLocal()
+        db_session.info["read_your_writes"] = True
+    async with db_session:
         yield db_session
-    finally:
-        db_session.close()
+
+def set_change_seq(response: Response, db_session: AsyncSession):
+    # Position of this request's last write in the change log
+    if "change_seq" in db_session.info:
+        response.headers["X-Change-Seq"] = str(db_session.info["change_seq"])
 
 @app.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user(db, username=form_data.username)
-    if not user or not utils.verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_read_db)):
+    user = await crud.get_user(db, username=form_data.username)
+    if not user or not await utils.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     access_token = auth.create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@app.get("/books/", response_model=list[schemas.Book])
-def read_books(skip: int = 0, limit: int = 10, db: Session = Depends(get_db), token: str = Depends(auth.oauth2_scheme)):
+# Dependency to collect GET /books/ filters and sort
+def book_filters(
+    author: Optional[str] = None,
+    genre: Optional[str] = None,
+    published_from: Optional[str] = Query(None, description="Inclusive lower bound on published_date"),
+    published_to: Optional[str] = Query(None, description="Inclusive upper bound on published_date"),
+    sort: Optional[str] = Query(None, pattern=r"^-?(id|title|author|genre|published_date)$",
+                                description="Sort field for skip/limit mode; prefix with - for descending")
+):
+    return schemas.BookQuery(author=author, genre=genre, published_from=published_from,
+                             published_to=published_to, sort=sort)
+
+def selected_fields(fields: Optional[str], allowed: tuple, default: tuple) -> tuple:
+    if fields is None:
+        return default
+    try:
+        return utils.parse_fields(fields, allowed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Authenticated responses may be stored by the client but must be revalidated
+CONDITIONAL_CACHE_CONTROL = "private, no-cache"
+
+def not_modified(etag: str, last_modified: datetime | None = None):
+    headers = {"ETag": etag, "Cache-Control": CONDITIONAL_CACHE_CONTROL}
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    return Response(status_code=304, headers=headers)
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+@app.get("/books/", response_model=Union[schemas.BookPage, list[schemas.BookSummary]])
+async def read_books(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    after: Optional[str] = Query(None, description="Opaque cursor from a previous page; pass an empty value to start cursor paging"),
+    order: Literal["id", "title"] = "id",
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,title,author; defaults to all but summary"),
+    filters: schemas.BookQuery = Depends(book_filters),
+    db: AsyncSession = Depends(get_read_db),
+    token: str = Depends(auth.oauth2_scheme)
+):
+    # Rows are tuples of the selected columns straight from the database;
+    # their trailing key columns feed the ETag and are dropped when encoding
+    auth.verify_token(token)
+    fields = selected_fields(fields, crud.BOOK_FIELDS, crud.LIST_FIELDS)
+    if after is not None and filters.sort:
+        # Cursors encode a position in id or title order only
+        raise HTTPException(status_code=400, detail="sort applies to skip/limit paging; use order with after")
+    key = None
+    if after:
+        try:
+            key = utils.decode_cursor(after, order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if_none_match = utils.parse_etags(request.headers.get("if-none-match"))
+    if after is None and skip < BOOK_CACHE_MAX_SKIP:
+        # Legacy skip/limit mode; the first pages come from the read cache,
+        # so revalidating them costs no query at all
+        books = await crud.get_books_cached(db=db, skip=skip, limit=limit, filters=filters, fields=fields)
+        etag = utils.list_etag(map(crud.row_version, books), fields=fields)
+        if if_none_match is not None and utils.etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return json_response(utils.row_dicts(fields, books), etag)
+
+    if if_none_match is not None:
+        # Revalidate from (id, version) pairs only, without loading or serializing rows
+        if after is None:
+            rows = await crud.get_books_versions(db, crud.books_query(skip, limit, filters))
+            etag = utils.list_etag(rows, fields=fields)
+        else:
+            rows = await crud.get_books_versions(db, crud.books_after_query(key, limit, order, filters))
+            etag = utils.list_etag(rows[:limit], has_more=len(rows) > limit, fields=fields)
+        if utils.etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    if after is None:
+        books = await crud.get_books(db=db, skip=skip, limit=limit, filters=filters, fields=fields)
+        etag = utils.list_etag(map(crud.row_version, books), fields=fields)
+        return json_response(utils.row_dicts(fields, books), etag)
+
+    books, next_key = await crud.get_books_after(db=db, after=key, limit=limit, order=order, filters=filters, fields=fields)
+    next_cursor = utils.encode_cursor(order, next_key) if next_key else None
+    etag = utils.list_etag(map(crud.row_version, books), has_more=next_key is not None, fields=fields)
+    return json_response({"items": utils.row_dicts(fields, books), "next_cursor": next_cursor}, etag)
+
+def json_response(content, etag: str) -> Response:
+    # Encoded in one pass by pydantic-core's serializer. Returning a Response
+    # skips FastAPI's validation against response_model, which stays for the
+    # OpenAPI schema only: these rows are already validated database values.
+    return Response(
+        to_json(content), media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": CONDITIONAL_CACHE_CONTROL},
+    )
+
+@app.get("/admin/query-plan", response_model=schemas.QueryPlan)
+async def books_query_plan(
+    cursor: bool = Query(False, description="Explain the cursor-mode query instead of skip/limit"),
+    order: Literal["id", "title"] = "id",
+    filters: schemas.BookQuery = Depends(book_filters),
+    db: AsyncSession = Depends(get_db),
+    token: str = Depends(auth.oauth2_scheme)
+):
+    # Shows how SQLite runs GET /books/ for the given filters, to catch full table scans
     auth.verify_token(token)
-    return crud.get_books(db=db, skip=skip, limit=limit)
+    if cursor:
+        query = crud.books_after_query(after=None, limit=10, order=order, filters=filters)
+    else:
+        query = crud.books_query(skip=0, limit=10, filters=filters)
+    sql, plan = await crud.explain_query(db, query)
+    full_scan = any(step.startswith("SCAN books") and "USING" not in step for step in plan)
+    return {"sql": sql, "plan": plan, "full_scan": full_scan}
+
+@app.get("/admin/cache")
+async def cache_stats(token: str = Depends(auth.oauth2_scheme)):
+    auth.verify_token(token)
+    return book_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    # Prometheus text exposition; unauthenticated like most scrape targets
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/admin/events")
+async def event_stats(token: str = Depends(auth.oauth2_scheme)):
+    auth.verify_token(token)
+    return {**event_manager.stats(), "outbox": outbox.stats()}
+
+def verify_profiling_admin(token: str):
+    # Registration is open, so a valid token alone is not enough
+    if auth.verify_token(token) not in profiling.PROFILING_ADMINS:
+        raise HTTPException(status_code=403, detail="Not a profiling admin")
+
+@app.get("/admin/profiling")
+async def profiling_stats(token: str = Depends(auth.oauth2_scheme)):
+    verify_profiling_admin(token)
+    return profiling.profiler.stats()
+
+@app.put("/admin/profiling")
+async def configure_profiling(settings: schemas.ProfilingSettings, token: str = Depends(auth.oauth2_scheme)):
+    # Applies to this worker process only
+    verify_profiling_admin(token)
+    profiling.profiler.configure(**settings.model_dump(exclude_unset=True, exclude_none=True))
+    return profiling.profiler.stats()
+
+@app.get("/books/search", response_model=list[schemas.SearchHit])
+async def search_books(
+    q: str = Query(..., min_length=1, description="Search terms; end a term with * for a prefix match"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+    token: str = Depends(auth.oauth2_scheme)
+):
+    auth.verify_token(token)
+    query = utils.fts_query(q)
+    if not query:
+        raise HTTPException(status_code=400, detail="Empty search query")
+    try:
+        hits = await crud.search_books(db=db, query=query, skip=skip, limit=limit)
+    except OperationalError:
+        raise HTTPException(status_code=400, detail="Invalid search query")
+    return Response(to_json(utils.row_dicts(crud.SEARCH_FIELDS, hits)), media_type="application/json")
+
+@app.get("/books/stats", response_model=schemas.BookStats)
+async def read_stats(
+    authors_limit: int = Query(100, ge=0, le=10000, description="Number of top authors to list"),
+    db: AsyncSession = Depends(get_read_db),
+    token: str = Depends(auth.oauth2_scheme)
+):
+    # Served from book_stats, which every write keeps current
+    auth.verify_token(token)
+    return await stats.get_stats(db, authors_limit)
+
+@app.get("/books/changes", response_model=schemas.ChangePage)
+async def read_changes(
+    since: int = Query(0, ge=0, description="Return changes after this sequence number"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+    token: str = Depends(auth.oauth2_scheme)
+):
+    auth.verify_token(token)
+    first, _ = await crud.get_change_bounds(db)
+    if first is not None and since < first - 1:
+        # Pruned changes cannot be replayed; start again from a full export
+        raise HTTPException(status_code=410, detail="Changes since this sequence number were pruned; re-sync from /books/export")
+    changes, has_more = await crud.get_changes(db, since, limit)
+    return {
+        "items": changes,
+        "next_since": changes[-1].seq if changes else since,
+        "has_more": has_more,
+    }
+
+@app.get("/books/export")
+async def export_books(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    fields: Optional[str] = Query(None, description="Comma-separated columns to export; defaults to all"),
+    db_session: AsyncSession = Depends(get_read_db),
+    token: str = Depends(auth.oauth2_scheme)
+):
+    auth.verify_token(token)
+    columns = selected_fields(fields, crud.EXPORT_FIELDS, crud.EXPORT_FIELDS)
+    # Taken before the export starts: replaying /books/changes?since= from
+    # here may repeat changes the export already has, but never misses one
+    _, change_seq = await crud.get_change_bounds(db_session)
+
+    async def export_stream():
+        # The response outlives the request dependencies, so the stream owns its session
+        count = 0
+        async with db.ReadSessionLocal() as session:
+            if format == "csv":
+                yield ",".join(columns) + "\n"
+            async for rows in crud.stream_books(session, columns):
+                if format == "csv":
+                    out = io.StringIO()
+                    csv.writer(out, lineterminator="\n").writerows([row[c] for c in columns] for row in rows)
+                    yield out.getvalue()
+                else:
+                    yield "".join(json.dumps(dict(row), default=str) + "\n" for row in rows)
+                count += len(rows)
+        await event_manager.emit("books_exported", {"count": count})
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_stream(),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename=books.{format}",
+            "X-Change-Seq": str(change_seq or 0),
+        }
+    )
 
 @app.get("/books/{book_id}", response_model=schemas.Book)
-def read_book(book_id: int, db: Session = Depends(get_db), token: str = Depends(auth.oauth2_scheme)):
+async def read_book(
+    book_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    token: str = Depends(auth.oauth2_scheme)
+):
     auth.verify_token(token)
-    book = crud.get_book(db=db, book_id=book_id)
+    if_none_match = utils.parse_etags(request.headers.get("if-none-match"))
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None or if_modified_since:
+        # A version lookup is enough to answer 304
+        current = await crud.get_book_version(db, book_id)
+        if current is not None:
+            version, updated_at = current
+            etag = utils.book_etag(book_id, version)
+            if if_none_match is not None:
+                if utils.etag_matches(if_none_match, etag):
+                    return not_modified(etag, updated_at)
+            elif updated_at and not_modified_since(updated_at, if_modified_since):
+                return not_modified(etag, updated_at)
+
+    book = await crud.get_book_cached(db=db, book_id=book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
+    response.headers["ETag"] = utils.book_etag(book["id"], book["version"])
+    response.headers["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+    if book["updated_at"]:
+        response.headers["Last-Modified"] = http_date(book["updated_at"])
     return book
 
+def not_modified_since(updated_at: datetime, header: str) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have one-second resolution
+    return updated_at.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
 @app.post("/users/", response_model=schemas.User)
-def create_new_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, username=user.username)
+async def create_new_user(
+    user: schemas.UserCreate,
+    db: AsyncSession = Depends(get_db),
+    write_db: AsyncSession = Depends(get_write_db)
+):
+    db_user = await crud.get_user(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user)
+    return await crud.create_user(db=write_db, user=user)
 
 
 
 @app.post("/books/", response_model=schemas.Book)
 async def create_book(
     book: schemas.BookCreate, 
-    db: Session = Depends(get_db), 
+    response: Response,
+    db: AsyncSession = Depends(get_write_db), 
     token: str = Depends(auth.oauth2_scheme)
 ):
     auth.verify_token(token)
-    return await crud.create_book(db=db, book=book)
+    db_book = await crud.create_book(db=db, book=book)
+    set_change_seq(response, db)
+    return db_book
+
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+@app.post("/books/bulk", response_model=schemas.BulkResult)
+async def bulk_create_books(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_write_db),
+    token: str = Depends(auth.oauth2_scheme)
+):
+    auth.verify_token(token)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "text/csv":
+        rows = utils.iter_csv_rows(request.stream())
+    elif content_type in NDJSON_CONTENT_TYPES:
+        rows = utils.iter_ndjson_rows(request.stream())
+    else:
+        raise HTTPException(status_code=415, detail="Send application/x-ndjson or text/csv")
+
+    inserted = 0
+    errors = []
+    batch = []
+
+    async def flush():
+        nonlocal inserted
+        ids, batch_errors = await crud.bulk_create_books(db=db, rows=batch)
+        inserted += len(ids)
+        errors.extend({"row": row, "error": error} for row, error in batch_errors)
+        batch.clear()
+
+    async for row_no, data in rows:
+        if isinstance(data, Exception):
+            errors.append({"row": row_no, "error": str(data)})
+            continue
+        try:
+            batch.append((row_no, schemas.BookCreate.model_validate(data)))
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors())
+            errors.append({"row": row_no, "error": message})
+            continue
+        if len(batch) >= crud.BULK_BATCH_SIZE:
+            await flush()
+    await flush()
+    set_change_seq(response, db)
+    return {"inserted": inserted, "errors": errors}
+
+@app.post("/books/batch", response_model=schemas.BatchResult)
+async def batch_books(
+    batch: schemas.BatchRequest,
+    response: Response,
+    db: AsyncSession = Depends(get_write_db),
+    token: str = Depends(auth.oauth2_scheme)
+):
+    # One token check, one lookup, one commit and one publish for the whole batch
+    auth.verify_token(token)
+    try:
+        results, committed = await crud.apply_batch(db=db, operations=batch.operations, atomic=batch.atomic)
+    except crud.BatchConflict:
+        raise HTTPException(status_code=409, detail="Books changed while the batch was applied; retry")
+    if not committed:
+        # Atomic batch with failed operations: nothing was written
+        response.status_code = 409
+        return {"applied": 0, "results": results}
+    set_change_seq(response, db)
+    return {"applied": sum(result["status"] < 400 for result in results), "results": results}
 
 @app.put("/books/{book_id}", response_model=schemas.Book)
 async def update_book(
     book_id: int, 
     book: schemas.BookCreate, 
-    db: Session = Depends(get_db), 
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_write_db), 
     token: str = Depends(auth.oauth2_scheme)
 ):
     auth.verify_token(token)
-    updated_book = await crud.update_book(db=db, book_id=book_id, book=book)
+    # If-Match gives optimistic concurrency: the update only applies to the named version
+    if_match = utils.parse_etags(request.headers.get("if-match"))
+    expected_versions = None
+    if if_match is not None and "*" not in if_match:
+        expected_versions = utils.etag_versions(if_match, book_id)
+    try:
+        updated_book = await crud.update_book(db=db, book_id=book_id, book=book, expected_versions=expected_versions)
+    except crud.VersionConflict:
+        raise HTTPException(status_code=412, detail="Book was modified; re-fetch and retry")
     if not updated_book:
         raise HTTPException(status_code=404, detail="Book not found")
+    response.headers["ETag"] = utils.book_etag(updated_book["id"], updated_book["version"])
+    set_change_seq(response, db)
     return updated_book
 
 @app.delete("/books/{book_id}")
 async def delete_book(
     book_id: int, 
-    db: Session = Depends(get_db), 
+    response: Response,
+    db: AsyncSession = Depends(get_write_db), 
     token: str = Depends(auth.oauth2_scheme)
 ):
     auth.verify_token(token)
     success = await crud.delete_book(db=db, book_id=book_id)
     if not success:
         raise HTTPException(status_code=404, detail="Book not found")
+    set_change_seq(response, db)
     return {"message": "Book deleted successfully"}
 
 
+# The page never changes while the app runs: browsers keep it for an hour,
+# then revalidate against the ETag
+STREAM_PAGE = os.path.join(os.path.dirname(__file__), "static", "stream.html")
+STREAM_PAGE_CACHE_CONTROL = "public, max-age=3600"
+
+@lru_cache(maxsize=None)
+def stream_page_content() -> tuple[bytes, str]:
+    # Read and hashed on the first request, not at import
+    with open(STREAM_PAGE, "rb") as f:
+        body = f.read()
+    return body, utils.content_etag(body)
+
 @app.get("/stream/html", response_class=HTMLResponse)
-async def stream_page():
-    html_content = """
-    <!DOCTYPE html>
-    <html>
-        <head>
-            <title>Book Updates Stream</title>
-            <style>
-                body { 
-                    font-family: Arial, sans-serif; 
-                    margin: 40px; 
-                    background-color: #f5f5f5;
-                }
-                h1 {
-                    color: #333;
-                    margin-bottom: 20px;
-                }
-                #events { 
-                    margin-top: 20px;
-                    padding: 20px;
-                    border: 1px solid #ddd;
-                    border-radius: 8px;
-                    min-height: 200px;
-                    max-height: 600px;
-                    overflow-y: auto;
-                    background-color: white;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                }
-                .event {
-                    margin: 10px 0;
-                    padding: 15px;
-                    border-radius: 6px;
-                    border-left: 4px solid #ccc;
-                    animation: fadeIn 0.5s ease-in;
-                }
-                @keyframes fadeIn {
-                    from { opacity: 0; transform: translateY(-10px); }
-                    to { opacity: 1; transform: translateY(0); }
-                }
-                .book_created {
-                    background-color: #e3f2fd;
-                    border-left-color: #2196F3;
-                }
-                .book_updated {
-                    background-color: #f1f8e9;
-                    border-left-color: #4CAF50;
-                }
-                .book_deleted {
-                    background-color: #ffebee;
-                    border-left-color: #f44336;
-                }
-                .timestamp {
-                    color: #666;
-                    font-size: 0.9em;
-                    margin-bottom: 5px;
-                }
-                .status {
-                    margin-top: 10px;
-                    padding: 10px;
-                    border-radius: 4px;
-                    background-color: #e8eaf6;
-                    text-align: center;
-                }
-                .error {
-                    background-color: #ffebee;
-                    color: #c62828;
-                }
-            </style>
-        </head>
-        <body>
-            <h1>📚 Real-time Book Updates</h1>
-            <div class="status" id="status">Connecting to server...</div>
-            <div id="events"></div>
-
-            <script>
-                const eventsDiv = document.getElementById('events');
-                const statusDiv = document.getElementById('status');
-                let eventSource;
-
-                function connect() {
-                    statusDiv.textContent = 'Connecting to server...';
-                    statusDiv.className = 'status';
-                    
-                    eventSource = new EventSource('/stream/data');
-                    
-                    eventSource.onopen = function() {
-                        statusDiv.textContent = '🟢 Connected - Listening for book updates...';
-                        statusDiv.style.backgroundColor = '#e8f5e9';
-                    };
-
-                    eventSource.onmessage = function(event) {
-                        try {
-                            const data = JSON.parse(event.data);
-                            console.log('Received event:', data);  // Debug log
-                            
-                            const newEvent = document.createElement('div');
-                            newEvent.className = `event ${data.type || ''}`;
-                            
-                            const timestamp = document.createElement('div');
-                            timestamp.className = 'timestamp';
-                            timestamp.textContent = new Date(data.timestamp).toLocaleString();
-                            
-                            const content = document.createElement('div');
-                            let message = '';
-                            
-                            if (data.type === 'book_created') {
-                                message = `📗 New book added: "${data.data.title}" by ${data.data.author}`;
-                            } else if (data.type === 'book_updated') {
-                                message = `📘 Book updated: "${data.data.title}" by ${data.data.author}`;
-                            } else if (data.type === 'book_deleted') {
-                                message = `📕 Book deleted: "${data.data.title}" (ID: ${data.data.id})`;
-                            } else {
-                                message = JSON.stringify(data.data || data.message || data);
-                            }
-                            
-                            content.textContent = message;
-                            
-                            newEvent.appendChild(timestamp);
-                            newEvent.appendChild(content);
-                            eventsDiv.insertBefore(newEvent, eventsDiv.firstChild);
-                            
-                            // Keep only last 50 events
-                            if (eventsDiv.children.length > 50) {
-                                eventsDiv.removeChild(eventsDiv.lastChild);
-                            }
-                        } catch (error) {
-                            console.error('Error processing event:', error);
-                        }
-                    };
-                    
-                    eventSource.onerror = function(error) {
-                        console.error('EventSource failed:', error);
-                        statusDiv.textContent = '🔴 Connection lost. Reconnecting...';
-                        statusDiv.className = 'status error';
-                        eventSource.close();
-                        setTimeout(connect, 5000);  // Try to reconnect after 5 seconds
-                    };
-                }
-
-                // Initial connection
-                connect();
-
-                // Cleanup on page unload
-                window.addEventListener('beforeunload', () => {
-                    if (eventSource) {
-                        eventSource.close();
-                    }
-                });
-            </script>
-        </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+async def stream_page(request: Request):
+    body, etag = stream_page_content()
+    headers = {"ETag": etag, "Cache-Control": STREAM_PAGE_CACHE_CONTROL}
+    if utils.etag_matches(utils.parse_etags(request.headers.get("if-none-match")) or [], etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=body, headers=headers)
                     
            
+SSE_KEEPALIVE = b": keep-alive\n\n"
+
 @app.get("/stream/data", response_class=StreamingResponse)
-async def stream_data():
+async def stream_data(
+    last_event_id: Optional[str] = Header(None),
+    resume_from: Optional[str] = Query(None, alias="last_event_id",
+                                       description="Same as the Last-Event-ID header, for clients that cannot set it"),
+    event_types: List[str] = Query([], alias="type", description="Only these event types; repeatable"),
+    genre: List[str] = Query([], description="Only events about books in these genres; repeatable"),
+    author: List[str] = Query([], description="Only events about books by these authors; repeatable"),
+    book_id: List[int] = Query([], description="Only events about these books; repeatable"),
+):
+    event_filter = EventFilter(event_types, genre, author, book_id)
+    keepalive = SSE_KEEPALIVE_SECONDS or None
+    window = SSE_COALESCE_MS / 1000
+
     async def event_stream():
+        listener_id = None
         try:
-            listener_id, queue = await event_manager.register()
+            listener_id, subscriber, replay = await event_manager.subscribe_from(last_event_id or resume_from, event_filter)
+            if replay is None:
+                # Missed events are no longer available: the client must re-fetch /books/
+                yield format_sse({"type": "resync_required", "reason": "missed events are no longer available"})
+            else:
+                for _, message in replay:
+                    yield message
             while True:
                 try:
-                    event = await queue.get()
-                    if event:
-                        yield f"data: {json.dumps(event)}\n\n"
+                    messages = await subscriber.get_messages(keepalive, window)
+                    if messages is None:
+                        # Closed by the overflow policy for falling too far behind
+                        yield format_sse({'type': 'disconnected', 'reason': 'slow consumer'})
+                        break
+                    # Everything queued goes out as one chunk; nothing queued
+                    # for SSE_KEEPALIVE_SECONDS means a comment line
+                    yield b"".join(messages) if messages else SSE_KEEPALIVE
                 except Exception as e:
-                    print(f"Error in stream: {e}")
-                    yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                    logger.exception("Error in stream")
+                    yield format_sse({'error': str(e)})
         except asyncio.CancelledError:
             event_manager.deregister(listener_id)
         finally:
@@ -284,9 +636,12 @@ async def stream_data():
     return StreamingResponse(
         event_stream(),
         media_type="text/event-stream",
+        # No Connection header: it is invalid over HTTP/2, and HTTP/1.1
+        # connections persist anyway. X-Accel-Buffering stops nginx from
+        # holding events back in its buffers.
         headers={
             "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
             "Access-Control-Allow-Origin": "*"
         }
     )
\ No newline at end of file
@@ -0,0 +1,197 @@
+# app/metrics.py
+import contextvars
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from sqlalchemy import event
+
+# Histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus text exposition.
+
+    Every observation happens on the event loop thread, so the counters need
+    no lock. Each label combination gets its own preallocated bucket list on
+    first use; observing after that only increments existing slots.
+    """
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self._children: dict[tuple, list] = {}
+        # Unlabelled histograms observe straight into this child
+        self._default = self.labels() if not labelnames else None
+
+    def labels(self, *values) -> list:
+        # [bucket counts..., +Inf count, sum]
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        return child
+
+    def observe(self, value: float, child: list | None = None):
+        child = child if child is not None else self._default
+        child[bisect_left(self.buckets, value)] += 1
+        child[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, child in self._children.items():
+            labels = ",".join(f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, child):
+                cumulative += count
+                yield f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}'
+            cumulative += child[len(self.buckets)]
+            yield f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}'
+            suffix = f"{{{labels}}}" if labels else ""
+            yield f"{self.name}_sum{suffix} {child[-1]}"
+            yield f"{self.name}_count{suffix} {cumulative}"
+
+
+class Sampled:
+    """Gauge or counter read from the application's own state at scrape time.
+
+    Nothing is recorded on the hot path; fn returns a number or a
+    {label value: number} dict for a single label.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable, kind: str = "gauge", labelname: str | None = None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+        self.labelname = labelname
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        value = self.fn()
+        if isinstance(value, dict):
+            for label, sample in value.items():
+                yield f'{self.name}{{{self.labelname}="{escape(label)}"}} {sample}'
+        else:
+            yield f"{self.name} {value}"
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # Only scrapes pay for formatting
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time until response headers are sent, by route and status.",
+    labelnames=("method", "route", "status"),
+))
+db_queries_per_request = registry.register(Histogram(
+    "db_queries_per_request", "SQL statements executed per request.", COUNT_BUCKETS, labelnames=("route",),
+))
+db_time_per_request = registry.register(Histogram(
+    "db_query_seconds_per_request", "Time spent in SQL statements per request.", labelnames=("route",),
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Duration of single SQL statements, in or out of requests.", FAST_BUCKETS,
+))
+jwt_decode_duration = registry.register(Histogram(
+    "auth_jwt_decode_seconds", "Time to verify a JWT that was not in the token cache.", FAST_BUCKETS,
+))
+password_duration = registry.register(Histogram(
+    "auth_password_seconds", "bcrypt hash/verify time including the wait for a pool thread.",
+    labelnames=("operation",),
+))
+event_emit_duration = registry.register(Histogram(
+    "events_emit_seconds", "EventManager.emit latency: hooks, publish and fan-out.", FAST_BUCKETS,
+))
+
+# Per-request [query count, query seconds], set by MetricsMiddleware
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    db_query_duration.observe(elapsed)
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def instrument_engine(sync_engine):
+    # For async engines pass engine.sync_engine; shared engines are instrumented once
+    if not event.contains(sync_engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request latency and per-request SQL stats.
+
+    Latency is measured to the response headers, so streaming responses
+    (SSE, exports) count their time to first byte rather than their lifetime.
+    Routes are labelled by path template, e.g. /books/{book_id}.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                route = route_label(scope)
+                request_duration.observe(
+                    time.perf_counter() - start,
+                    request_duration.labels(scope["method"], route, message["status"]),
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_db.reset(token)
+            route = route_label(scope)
+            db_queries_per_request.observe(stats[0], db_queries_per_request.labels(route))
+            db_time_per_request.observe(stats[1], db_time_per_request.labels(route))
+
+
+def route_label(scope) -> str:
+    # Unmatched paths share one label so scanners cannot blow up cardinality
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
@@ -0,0 +1,126 @@
+# app/migrations.py
+"""Schema checks against Alembic's revision history.
+
+The app no longer creates tables itself: at startup it compares the
+database's alembic_version with the newest migration and, unless
+SCHEMA_AUTO_UPGRADE is off, creates a missing schema or upgrades an
+outdated one. With several workers or replicas, migrate once before
+starting them:
+
+    python -m app.migrations upgrade
+    python -m app.migrations check
+"""
+import os
+import re
+import sys
+
+from decouple import config
+from sqlalchemy import Engine, inspect, text
+
+# Off: refuse to start on an outdated schema instead of migrating it
+SCHEMA_AUTO_UPGRADE = config("SCHEMA_AUTO_UPGRADE", default=True, cast=bool)
+SCRIPT_LOCATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic")
+REVISION_LINE = re.compile(r"^(revision|down_revision)\b[^=\n]*=\s*['\"]([0-9a-f]+)['\"]", re.MULTILINE)
+
+
+def alembic_config(engine: Engine):
+    # Alembic is imported here, not at module level: most starts only need
+    # a single SELECT from alembic_version
+    from alembic.config import Config
+
+    # No ini file, so env.py leaves the app's logging configuration alone
+    alembic = Config()
+    alembic.set_main_option("script_location", SCRIPT_LOCATION)
+    alembic.set_main_option("sqlalchemy.url", engine.url.render_as_string(hide_password=False).replace("%", "%%"))
+    return alembic
+
+
+def revisions(engine: Engine) -> tuple[str | None, str, bool]:
+    """(current revision, head revision, whether the books table exists)."""
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    head = ScriptDirectory.from_config(alembic_config(engine)).get_current_head()
+    with engine.connect() as connection:
+        current = MigrationContext.configure(connection).get_current_revision()
+        has_tables = inspect(connection).has_table("books")
+    return current, head, has_tables
+
+
+def script_heads() -> set[str]:
+    # Heads of the revision graph straight from the files: importing Alembic
+    # costs ~55ms of cold start (it loads every dialect's DDL support). Merge
+    # revisions, with tuples for down_revision, come out as several heads.
+    found, parents = set(), set()
+    for name in os.listdir(os.path.join(SCRIPT_LOCATION, "versions")):
+        if name.endswith(".py"):
+            with open(os.path.join(SCRIPT_LOCATION, "versions", name)) as f:
+                for key, value in REVISION_LINE.findall(f.read()):
+                    (found if key == "revision" else parents).add(value)
+    return found - parents
+
+
+def stamped(engine: Engine) -> list[str]:
+    with engine.connect() as connection:
+        if not inspect(connection).has_table("alembic_version"):
+            return []
+        return list(connection.execute(text("SELECT version_num FROM alembic_version")).scalars())
+
+
+def ensure(engine: Engine, auto_upgrade: bool = SCHEMA_AUTO_UPGRADE):
+    """Startup check: returns once the schema is at head, raises RuntimeError otherwise."""
+    heads = script_heads()
+    if len(heads) == 1 and stamped(engine) == list(heads):
+        return
+    # Anything unusual gets Alembic's own answer
+    current, head, has_tables = revisions(engine)
+    if current == head:
+        return
+    if not auto_upgrade:
+        raise RuntimeError(f"Database schema is at {current or 'nothing'}, the app needs {head}: run `alembic upgrade head`.")
+    upgrade(engine)
+    print(f"Database schema upgraded from {current or 'nothing'} to {head}")
+
+
+def upgrade(engine: Engine):
+    from alembic import command
+
+    current, _, has_tables = revisions(engine)
+    if current is None and has_tables:
+        raise RuntimeError(
+            "The database has tables but no Alembic revision (it was made by create_all). "
+            "Run `alembic stamp <revision it matches>` and then `alembic upgrade head`."
+        )
+    if current is None:
+        # The first migration rebuilds an existing books table, so an empty
+        # database gets the current models directly, stamped as head
+        create_all(engine)
+    else:
+        command.upgrade(alembic_config(engine), "head")
+
+
+def create_all(engine: Engine):
+    """Create the current schema directly and stamp it as head; for scratch databases."""
+    from alembic import command
+
+    from app import models
+
+    models.Base.metadata.create_all(bind=engine)
+    command.stamp(alembic_config(engine), "head")
+
+
+def main(command: str) -> int:
+    from app.db import engine
+
+    if command == "upgrade":
+        upgrade(engine)
+        return 0
+    current, head, _ = revisions(engine)
+    print(f"current {current or 'nothing'}, head {head}")
+    return 0 if current == head else 1
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in (["check"], ["upgrade"]):
+        sys.exit("Usage: python -m app.migrations check|upgrade")
+    sys.exit(main(sys.argv[1]))
@@ -1,6 +1,9 @@
-from sqlalchemy import Column, Integer, String, Boolean
-from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
 
+from sqlalchemy import DDL, JSON, Column, DateTime, Index, Integer, String, Boolean, event, text
+from sqlalchemy.orm import declarative_base
+
+# The only declarative base: alembic's env.py and app.migrations use its metadata
 Base = declarative_base()
 
 class Book(Base):
@@ -12,6 +15,99 @@ class Book(Base):
     published_date = Column(String, nullable=True)  
     summary = Column(String, nullable=True)
     genre = Column(String, nullable=False) 
+    # Bumped by crud.update_book; serves as the ETag and the If-Match check
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow)
+
+    # Composite indexes for GET /books/ filters and sorts (alembic revision 9b4e6c1d2a57).
+    # Trailing columns let filtered listings come back already sorted.
+    __table_args__ = (
+        Index("ix_books_author_title", "author", "title"),
+        Index("ix_books_genre_title", "genre", "title"),
+        Index("ix_books_author_published_date", "author", "published_date"),
+        Index("ix_books_genre_published_date", "genre", "published_date"),
+        Index("ix_books_published_date", "published_date"),
+    )
+
+
+# Full-text index over books, kept in sync by triggers so every write path
+# (single, bulk, raw SQL) updates it in the same transaction.
+# Mirrors alembic revision 3f1c2b7a9d10.
+BOOKS_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, summary, genre,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, summary, genre)
+        VALUES (new.id, new.title, new.author, new.summary, new.genre);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, summary, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.summary, old.genre);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, summary, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.summary, old.genre);
+        INSERT INTO books_fts(rowid, title, author, summary, genre)
+        VALUES (new.id, new.title, new.author, new.summary, new.genre);
+    END
+    """,
+]
+
+for statement in BOOKS_FTS_DDL:
+    event.listen(Book.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+class BookChange(Base):
+    """Change log / transactional outbox for book writes.
+
+    crud writes a row in the same transaction as the change itself, so a
+    committed write always has its event. published is set once the event
+    has gone out on the event bus (see app/outbox.py).
+    """
+    __tablename__ = "book_changes"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    type = Column(String, nullable=False)
+    # Null for batch events covering several books
+    book_id = Column(Integer, nullable=True)
+    data = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    published = Column(Boolean, nullable=False, default=False, server_default="0")
+
+    __table_args__ = (
+        # Only the few rows still waiting for the relay are indexed
+        Index("ix_book_changes_pending", "seq", sqlite_where=text("published = 0")),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class BookStat(Base):
+    """Book counts per genre and per author plus the total.
+
+    Adjusted by crud in the same transaction as every book write (see
+    app/stats.py), so GET /books/stats never scans books.
+    """
+    __tablename__ = "book_stats"
+
+    # "total" (with an empty name), "genre" or "author"
+    kind = Column(String, primary_key=True)
+    name = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Largest genres/authors first without sorting
+        Index("ix_book_stats_kind_count", "kind", "count"),
+    )
 
 
 class User(Base):
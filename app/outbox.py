@@ -0,0 +1,146 @@
+# app/outbox.py
+import asyncio
+from datetime import datetime, timedelta
+
+from decouple import config
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.db import WriteSessionLocal
+from app.events import event_manager
+
+# How often published marks are flushed and stale rows swept
+OUTBOX_INTERVAL = config("OUTBOX_INTERVAL", default=1.0, cast=float)
+# Unpublished rows older than this are assumed orphaned by a crashed worker
+OUTBOX_GRACE = config("OUTBOX_GRACE", default=10.0, cast=float)
+# Published change log rows kept for GET /books/changes
+CHANGE_LOG_RETENTION = config("CHANGE_LOG_RETENTION", default=100_000, cast=int)
+OUTBOX_BATCH_SIZE = 500
+
+
+class OutboxRelay:
+    """Publishes book_changes rows to the event bus.
+
+    The worker that wrote a change publishes it right after commit. Marking
+    rows as published is batched into one UPDATE per interval, so writes pay
+    for a single transaction. Rows whose writer died before publishing are
+    claimed after OUTBOX_GRACE seconds and published by whichever worker gets
+    there first. Delivery is at-least-once: a crash between publishing and
+    the next mark flush republishes those rows on restart.
+    """
+
+    def __init__(self, interval: float = OUTBOX_INTERVAL, grace: float = OUTBOX_GRACE,
+                 retention: int = CHANGE_LOG_RETENTION):
+        self.interval = interval
+        self.grace = grace
+        self.retention = retention
+        self._pending_marks: list[int] = []
+        self._task = None
+        self.published = 0
+        self.recovered = 0
+        self.pruned = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        async with WriteSessionLocal() as session:
+            await self.flush_marks(session)
+
+    async def publish(self, db: AsyncSession, changes: list[models.BookChange]):
+        # Called by crud after commit; event hooks run before this returns
+        for change in changes:
+            await event_manager.emit(change.type, change.data, change_seq=change.seq)
+            self._pending_marks.append(change.seq)
+        self.published += len(changes)
+        # Handlers return it as X-Change-Seq for read-your-writes
+        db.info["change_seq"] = changes[-1].seq
+        if self._task is None:
+            # No relay loop (scripts, tests): mark right away
+            await self.flush_marks(db)
+
+    async def flush_marks(self, db: AsyncSession):
+        marks, self._pending_marks = self._pending_marks, []
+        if not marks:
+            return
+        try:
+            for start in range(0, len(marks), OUTBOX_BATCH_SIZE):
+                await db.execute(
+                    update(models.BookChange)
+                    .where(models.BookChange.seq.in_(marks[start:start + OUTBOX_BATCH_SIZE]))
+                    .values(published=True)
+                )
+            await db.commit()
+        except Exception:
+            # Retried on the next flush
+            await db.rollback()
+            self._pending_marks[:0] = marks
+            raise
+
+    async def recover(self, db: AsyncSession):
+        # Claim with a conditional UPDATE so only one worker publishes each orphan
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace)
+        result = await db.execute(
+            select(models.BookChange.seq)
+            .where(models.BookChange.published == False, models.BookChange.created_at < cutoff)  # noqa: E712
+            .order_by(models.BookChange.seq)
+            .limit(OUTBOX_BATCH_SIZE)
+        )
+        stale = list(result.scalars())
+        if not stale:
+            return
+        result = await db.execute(
+            update(models.BookChange)
+            .where(models.BookChange.seq.in_(stale), models.BookChange.published == False)  # noqa: E712
+            .values(published=True)
+            .returning(models.BookChange.seq, models.BookChange.type, models.BookChange.data)
+        )
+        claimed = sorted(result.all())
+        await db.commit()
+        for seq, change_type, data in claimed:
+            await event_manager.emit(change_type, data, change_seq=seq)
+        self.recovered += len(claimed)
+
+    async def prune(self, db: AsyncSession):
+        # Keep the newest `retention` rows; unpublished ones are never pruned
+        last = (await db.execute(select(func.max(models.BookChange.seq)))).scalar()
+        if last is None or last <= self.retention:
+            return
+        result = await db.execute(
+            delete(models.BookChange)
+            .where(models.BookChange.seq <= last - self.retention, models.BookChange.published == True)  # noqa: E712
+        )
+        await db.commit()
+        self.pruned += result.rowcount
+
+    async def _run(self):
+        ticks = 0
+        while True:
+            await asyncio.sleep(self.interval)
+            ticks += 1
+            try:
+                async with WriteSessionLocal() as session:
+                    await self.flush_marks(session)
+                    await self.recover(session)
+                    # Pruning is a bigger delete, so it runs less often
+                    if ticks % 60 == 1:
+                        await self.prune(session)
+            except Exception as e:
+                print(f"Error in outbox relay: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "recovered": self.recovered,
+            "pruned": self.pruned,
+            "pending_marks": len(self._pending_marks),
+        }
+
+
+# Create a global outbox relay instance
+outbox = OutboxRelay()
@@ -0,0 +1,292 @@
+# app/profiling.py
+import asyncio
+import cProfile
+import linecache
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from itertools import count
+
+from decouple import Csv, config
+from sqlalchemy import event
+
+from app.metrics import route_label
+
+# Off by default; PUT /admin/profiling changes any of these at runtime
+# JWT subjects allowed to use /admin/profiling. Profiles include other
+# requests' SQL parameters, and an aggressive setting slows every request,
+# so nobody may by default.
+PROFILING_ADMINS = frozenset(config("PROFILING_ADMINS", default="", cast=Csv()))
+PROFILE_ENABLED = config("PROFILE_ENABLED", default=False, cast=bool)
+PROFILE_SAMPLE_RATE = config("PROFILE_SAMPLE_RATE", default=0.05, cast=float)
+PROFILE_SLOW_REQUEST_MS = config("PROFILE_SLOW_REQUEST_MS", default=250.0, cast=float)
+PROFILE_MODE = config("PROFILE_MODE", default="stack")
+PROFILE_INTERVAL_MS = config("PROFILE_INTERVAL_MS", default=5.0, cast=float)
+PROFILE_DIR = config("PROFILE_DIR", default="./profiles")
+PROFILE_MAX_FILES = config("PROFILE_MAX_FILES", default=200, cast=int)
+SLOW_QUERY_MS = config("SLOW_QUERY_MS", default=0.0, cast=float)
+SLOW_QUERY_EXPLAIN = config("SLOW_QUERY_EXPLAIN", default=True, cast=bool)
+
+# Leaf frames of threads parked on a lock or the selector. Pool and
+# aiosqlite threads block inside C queue gets, seen by the leaf's source line.
+IDLE_LEAVES = {("threading", "wait"), ("selectors", "select"), ("queue", "get")}
+IDLE_LINE = re.compile(r"\.get\((\)|block|timeout)")
+PLANNED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class RequestProfile:
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.samples = Counter() if mode == "stack" else None
+        self.profile = cProfile.Profile() if mode == "cprofile" else None
+        self.cancelled = False
+
+
+class Profiler:
+    """Opt-in request profiler and slow-query log.
+
+    A fraction of requests is profiled; only those slower than the threshold
+    are written out. "stack" mode samples every thread (event loop, aiosqlite
+    connections, bcrypt workers) into folded stacks for flamegraph.pl or
+    speedscope; "cprofile" mode writes pstats files covering the event loop
+    thread, one request at a time. Both see whatever else the loop runs
+    while the request is in flight.
+    """
+
+    def __init__(self):
+        self.enabled = PROFILE_ENABLED
+        self.sample_rate = PROFILE_SAMPLE_RATE
+        self.slow_request_ms = PROFILE_SLOW_REQUEST_MS
+        self.mode = PROFILE_MODE
+        self.interval_ms = PROFILE_INTERVAL_MS
+        self.output_dir = PROFILE_DIR
+        self.max_files = PROFILE_MAX_FILES
+        self.slow_query_ms = SLOW_QUERY_MS
+        self.explain = SLOW_QUERY_EXPLAIN
+        self.sampled = 0
+        self.written = 0
+        self.slow_queries = 0
+        self.recent_files = deque(maxlen=20)
+        self.recent_queries = deque(maxlen=50)
+        self._active: list[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._cprofile_busy = False
+        self._file_seq = count()
+
+    def configure(self, **settings):
+        for name, value in settings.items():
+            setattr(self, name, value)
+
+    def settings(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_request_ms": self.slow_request_ms,
+            "mode": self.mode,
+            "interval_ms": self.interval_ms,
+            "output_dir": self.output_dir,
+            "max_files": self.max_files,
+            "slow_query_ms": self.slow_query_ms,
+            "explain": self.explain,
+        }
+
+    def stats(self) -> dict:
+        return {
+            **self.settings(),
+            "sampled": self.sampled,
+            "in_flight": len(self._active),
+            "written": self.written,
+            "recent_files": list(self.recent_files),
+            "slow_queries": self.slow_queries,
+            "recent_slow_queries": list(self.recent_queries),
+        }
+
+    def should_sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def begin(self) -> RequestProfile | None:
+        if self.mode == "cprofile":
+            # One cProfile per thread at a time; concurrent picks are skipped
+            if self._cprofile_busy:
+                return None
+            self._cprofile_busy = True
+            request = RequestProfile("cprofile")
+            request.profile.enable()
+        else:
+            request = RequestProfile("stack")
+            with self._lock:
+                self._active.append(request)
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                    self._sampler.start()
+        self.sampled += 1
+        return request
+
+    def cancel(self, request: RequestProfile):
+        # Streams that outlive any sensible profile, e.g. SSE
+        if not request.cancelled:
+            request.cancelled = True
+            self._stop(request)
+
+    def end(self, request: RequestProfile, scope, elapsed: float) -> str | None:
+        """Stops collecting; returns the file to write when the request was slow."""
+        if request.cancelled:
+            return None
+        request.cancelled = True
+        self._stop(request)
+        if elapsed * 1000 < self.slow_request_ms:
+            return None
+        route = re.sub(r"[^A-Za-z0-9]+", "_", route_label(scope)).strip("_") or "root"
+        extension = "prof" if request.mode == "cprofile" else "folded"
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{next(self._file_seq)}-{scope['method']}-{route}-{elapsed * 1000:.0f}ms.{extension}"
+        return os.path.join(self.output_dir, name)
+
+    def write(self, request: RequestProfile, path: str):
+        # Runs in a worker thread
+        os.makedirs(self.output_dir, exist_ok=True)
+        if request.mode == "cprofile":
+            request.profile.dump_stats(path)
+        else:
+            with open(path, "w") as f:
+                # Snapshot: the sampler may still be finishing a pass
+                for stack, samples in list(request.samples.items()):
+                    f.write(f"{stack} {samples}\n")
+        self.written += 1
+        self.recent_files.append(path)
+        self._prune()
+
+    def _stop(self, request: RequestProfile):
+        if request.mode == "cprofile":
+            request.profile.disable()
+            self._cprofile_busy = False
+        else:
+            with self._lock:
+                self._active.remove(request)
+
+    def _prune(self):
+        files = [
+            os.path.join(self.output_dir, name) for name in os.listdir(self.output_dir)
+            if name.endswith((".folded", ".prof"))
+        ]
+        if len(files) > self.max_files:
+            files.sort(key=os.path.getmtime)
+            for path in files[:len(files) - self.max_files]:
+                os.remove(path)
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = list(self._active)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = fold(frame)
+                if stack is None:
+                    continue
+                stack = f"{names.get(ident, ident)};{stack}"
+                for request in active:
+                    request.samples[stack] += 1
+            time.sleep(self.interval_ms / 1000)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.slow_query_ms:
+            context._profile_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_profile_start", None)
+        if start is None or not self.slow_query_ms:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms < self.slow_query_ms:
+            return
+        plan = None
+        if self.explain and not executemany and conn.dialect.name == "sqlite" \
+                and statement.lstrip().upper().startswith(PLANNED_STATEMENTS):
+            plan = explain(conn, statement, parameters)
+        params = "<redacted>" if "hashed_password" in statement else truncate(repr(parameters))
+        self.slow_queries += 1
+        self.recent_queries.append({
+            "at": time.time(), "ms": round(elapsed_ms, 2), "statement": statement, "params": params, "plan": plan,
+        })
+        print(f"Slow query ({elapsed_ms:.1f}ms): {' '.join(statement.split())} params={params}"
+              + (f" plan={plan}" if plan else ""))
+
+
+def fold(frame) -> str | None:
+    # Root-first "module:function" frames joined by ";" (the folded stack format)
+    code = frame.f_code
+    if (frame.f_globals.get("__name__"), code.co_name) in IDLE_LEAVES \
+            or IDLE_LINE.search(linecache.getline(code.co_filename, frame.f_lineno)):
+        return None
+    frames = []
+    while frame is not None:
+        frames.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+def explain(conn, statement: str, parameters) -> list[str]:
+    # A separate DBAPI cursor on the same connection, so the plan sees the
+    # same transaction and no engine events fire for it
+    try:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return [row[3] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as e:
+        return [f"unavailable: {e}"]
+
+
+def truncate(text: str, limit: int = 300) -> str:
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+profiler = Profiler()
+
+
+def instrument_engine(sync_engine):
+    # Always listening; the handlers return at once while slow_query_ms is 0
+    if not event.contains(sync_engine, "before_cursor_execute", profiler.before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", profiler.before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", profiler.after_cursor_execute)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware profiling a sample of requests while enabled."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.should_sample():
+            return await self.app(scope, receive, send)
+        request = profiler.begin()
+        if request is None:
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+                if content_type.startswith(b"text/event-stream"):
+                    profiler.cancel(request)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            path = profiler.end(request, scope, time.perf_counter() - start)
+            if path is not None:
+                await asyncio.to_thread(profiler.write, request, path)
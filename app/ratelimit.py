@@ -0,0 +1,269 @@
+# app/ratelimit.py
+import hashlib
+import math
+import mmap
+import os
+import struct
+import time
+from collections import Counter, OrderedDict
+
+from decouple import config
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app import auth
+
+RATE_LIMIT_ENABLED = config("RATE_LIMIT_ENABLED", default=True, cast=bool)
+# "local" keeps the buckets in this process, so every worker grants the full
+# budget; "shared" keeps them in a memory-mapped file that all workers on
+# the host open
+RATE_LIMIT_BACKEND = config("RATE_LIMIT_BACKEND", default="local")
+RATE_LIMIT_PATH = config("RATE_LIMIT_PATH", default="./ratelimit.bin")
+RATE_LIMIT_MAX_KEYS = config("RATE_LIMIT_MAX_KEYS", default=100_000, cast=int)
+# Proxies in front of the app that append the address they saw to
+# X-Forwarded-For (1 behind the Heroku router); 0 keys on the peer address
+RATE_LIMIT_TRUSTED_HOPS = config("RATE_LIMIT_TRUSTED_HOPS", default=0, cast=int)
+
+# Budget -> (tokens per second, bucket size)
+BUDGETS = {
+    "read": (config("RATE_LIMIT_READ_RATE", default=50.0, cast=float),
+             config("RATE_LIMIT_READ_BURST", default=200.0, cast=float)),
+    "write": (config("RATE_LIMIT_WRITE_RATE", default=10.0, cast=float),
+              config("RATE_LIMIT_WRITE_BURST", default=50.0, cast=float)),
+    # /login and POST /users/: each attempt costs a bcrypt hash or check
+    "login": (config("RATE_LIMIT_LOGIN_RATE", default=0.2, cast=float),
+              config("RATE_LIMIT_LOGIN_BURST", default=10.0, cast=float)),
+    # New /stream/data connections
+    "sse": (config("RATE_LIMIT_SSE_RATE", default=0.5, cast=float),
+            config("RATE_LIMIT_SSE_BURST", default=10.0, cast=float)),
+}
+# Open /stream/data connections per client, counted per worker
+RATE_LIMIT_SSE_CONNECTIONS = config("RATE_LIMIT_SSE_CONNECTIONS", default=10, cast=int)
+# Suggested wait when a client is at its stream limit
+STREAM_RETRY_AFTER = 10
+
+# Health checks and scrapes
+EXEMPT_PATHS = {"/", "/metrics"}
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+LOGIN_PATHS = {"/login", "/users/"}
+
+
+class LocalBackend:
+    """Buckets in a dict; past max_keys the least recently used is dropped."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[str, list] = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        # 0 when a token was taken, else the seconds until one is available
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [burst, now]
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / rate
+
+
+# key hash, tokens, last refill
+SLOT = struct.Struct("<Qdd")
+WAYS = 8
+
+
+class SharedBackend:
+    """Buckets in a memory-mapped file shared by every worker on the host.
+
+    The file is a fixed table of groups of WAYS slots. A key hashes to one
+    group, and a check reads and rewrites that group's 192 bytes under a
+    byte-range lock on them alone. A full group reuses its least recently
+    refilled slot, handing that client a fresh bucket, so size the table
+    well above the number of active clients. time.monotonic is system-wide
+    on Linux, so workers agree on refill times.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_PATH, slots: int = RATE_LIMIT_MAX_KEYS):
+        self.path = path
+        self.slots = slots
+        self.groups = 0
+        self._fd = None
+        self._map = None
+
+    def open(self):
+        # Opened on first use; POSIX only
+        import fcntl
+
+        self._lockf, self._lock, self._unlock = fcntl.lockf, fcntl.LOCK_EX, fcntl.LOCK_UN
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        group_size = WAYS * SLOT.size
+        wanted = max(1, self.slots // WAYS) * group_size
+        if os.fstat(fd).st_size < wanted:
+            os.ftruncate(fd, wanted)
+        # Workers started with a smaller setting use the file as it is
+        size = os.fstat(fd).st_size // group_size * group_size
+        self._map = mmap.mmap(fd, size)
+        self.groups = size // group_size
+        self._fd = fd
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map = self._fd = None
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        if self._map is None:
+            self.open()
+        # A stable hash: hash() differs between processes. 0 marks an empty slot.
+        tag = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        start = tag % self.groups * WAYS * SLOT.size
+        self._lockf(self._fd, self._lock, WAYS * SLOT.size, start)
+        try:
+            # Read under the lock: a time taken before waiting for it could
+            # be older than the stamp another worker just wrote
+            now = time.monotonic()
+            slot, tokens, stamp = None, burst, now
+            victim, oldest = start, math.inf
+            for offset in range(start, start + WAYS * SLOT.size, SLOT.size):
+                slot_tag, slot_tokens, slot_stamp = SLOT.unpack_from(self._map, offset)
+                if slot_tag == tag:
+                    slot, tokens, stamp = offset, slot_tokens, slot_stamp
+                    break
+                if slot_stamp < oldest:
+                    victim, oldest = offset, slot_stamp
+            # A clock behind the stored stamp (after a reboot) refills nothing
+            tokens = min(burst, tokens + max(0.0, now - stamp) * rate)
+            if tokens >= 1:
+                tokens, wait = tokens - 1, 0.0
+            else:
+                wait = (1 - tokens) / rate
+            SLOT.pack_into(self._map, victim if slot is None else slot, tag, tokens, now)
+            return wait
+        finally:
+            self._lockf(self._fd, self._unlock, WAYS * SLOT.size, start)
+
+
+def create_backend(backend: str = RATE_LIMIT_BACKEND):
+    if backend == "local":
+        return LocalBackend()
+    if backend == "shared":
+        return SharedBackend()
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+class RateLimiter:
+    """Token buckets per client and budget, plus a cap on open streams.
+
+    Clients are the JWT subject when the request carries a valid token,
+    otherwise the client address: behind trusted_hops proxies, the
+    X-Forwarded-For entry the outermost of them appended (see client_key).
+    A check is a couple of dict lookups, or one locked read-modify-write of
+    a shared slot.
+    """
+
+    def __init__(self, backend=None, budgets: dict = BUDGETS, enabled: bool = RATE_LIMIT_ENABLED,
+                 max_streams: int = RATE_LIMIT_SSE_CONNECTIONS, trusted_hops: int = RATE_LIMIT_TRUSTED_HOPS):
+        self.backend = backend if backend is not None else create_backend()
+        self.budgets = budgets
+        self.enabled = enabled
+        self.max_streams = max_streams
+        self.trusted_hops = trusted_hops
+        self.streams = Counter()
+        self.rejected = Counter()
+
+    def check(self, budget: str, client: str) -> float:
+        """0 when the request may go ahead, else seconds to wait."""
+        rate, burst = self.budgets[budget]
+        wait = self.backend.take(f"{budget}:{client}", rate, burst)
+        if wait:
+            self.rejected[budget] += 1
+        return wait
+
+
+rate_limiter = RateLimiter()
+
+
+def budget_for(method: str, path: str) -> str | None:
+    if path in EXEMPT_PATHS:
+        return None
+    if method == "POST" and path in LOGIN_PATHS:
+        return "login"
+    if path == "/stream/data":
+        return "sse"
+    return "read" if method in READ_METHODS else "write"
+
+
+def client_address(scope, trusted_hops: int = RATE_LIMIT_TRUSTED_HOPS) -> str:
+    # Each trusted proxy appends the address it saw, so the entry trusted_hops
+    # from the right is the client as the outermost proxy saw it. Entries to
+    # its left come from the client itself and are never used: a fresh
+    # value on every request would otherwise mean a fresh bucket.
+    if trusted_hops:
+        forwarded = [
+            entry.strip()
+            for name, value in scope["headers"] if name == b"x-forwarded-for"
+            for entry in value.decode("latin-1").split(",")
+        ]
+        if len(forwarded) >= trusted_hops:
+            return forwarded[-trusted_hops]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def client_key(scope, trusted_hops: int = RATE_LIMIT_TRUSTED_HOPS) -> str:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                # Cached after the first request with this token
+                try:
+                    subject = auth.verify_token(token)
+                except HTTPException:
+                    subject = None
+                if subject:
+                    return f"user:{subject}"
+            break
+    return f"ip:{client_address(scope, trusted_hops)}"
+
+
+def too_many_requests(retry_after: float, detail: str = "Rate limit exceeded") -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=429, headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware answering 429 with Retry-After over budget."""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled:
+            return await self.app(scope, receive, send)
+        budget = budget_for(scope["method"], scope["path"])
+        if budget is None:
+            return await self.app(scope, receive, send)
+        client = client_key(scope, self.limiter.trusted_hops)
+        if budget == "sse" and self.limiter.streams[client] >= self.limiter.max_streams:
+            self.limiter.rejected["streams"] += 1
+            return await too_many_requests(STREAM_RETRY_AFTER, "Too many open streams")(scope, receive, send)
+        wait = self.limiter.check(budget, client)
+        if wait:
+            return await too_many_requests(wait)(scope, receive, send)
+        if budget != "sse":
+            return await self.app(scope, receive, send)
+        self.limiter.streams[client] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.streams[client] -= 1
+            if not self.limiter.streams[client]:
+                del self.limiter.streams[client]
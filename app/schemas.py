@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import Dict, List, Literal, Optional
 
 class BookBase(BaseModel):
     title: str
@@ -14,8 +15,113 @@ class BookCreate(BookBase):
 class Book(BookBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class SearchHit(Book):
+    score: float
+    snippet: Optional[str] = None
+
+class BookSummary(BaseModel):
+    # List projection: only the fields asked for with ?fields= are present,
+    # all but summary by default
+    id: Optional[int] = None
+    title: Optional[str] = None
+    author: Optional[str] = None
+    published_date: Optional[str] = None
+    summary: Optional[str] = None
+    genre: Optional[str] = None
+
+class BookPage(BaseModel):
+    items: List[BookSummary]
+    next_cursor: Optional[str] = None
+
+class BulkRowError(BaseModel):
+    row: int
+    error: str
+
+class BulkResult(BaseModel):
+    inserted: int
+    errors: List[BulkRowError]
+
+class BatchOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    # Book to update or delete
+    id: Optional[int] = None
+    # New book for create; fields to change for update (unset optional fields are kept)
+    book: Optional[BookCreate] = None
+    # Apply only if the book is still at this version, like If-Match
+    version: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_arguments(self):
+        if self.op != "create" and self.id is None:
+            raise ValueError(f"{self.op} needs an id")
+        if self.op != "delete" and self.book is None:
+            raise ValueError(f"{self.op} needs a book")
+        return self
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=1000)
+    # Apply nothing unless every operation succeeds
+    atomic: bool = False
+
+class BatchOperationResult(BaseModel):
+    index: int
+    op: str
+    id: Optional[int] = None
+    status: int
+    version: Optional[int] = None
+    error: Optional[str] = None
+
+class BatchResult(BaseModel):
+    applied: int
+    results: List[BatchOperationResult]
+
+class BookStats(BaseModel):
+    total: int
+    # Largest first
+    genres: Dict[str, int]
+    authors: Dict[str, int]
+    distinct_authors: int
+
+class BookChange(BaseModel):
+    seq: int
+    type: str
+    book_id: Optional[int] = None
+    data: dict
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ChangePage(BaseModel):
+    items: List[BookChange]
+    # Pass as ?since= to continue
+    next_since: int
+    has_more: bool
+
+class BookQuery(BaseModel):
+    author: Optional[str] = None
+    genre: Optional[str] = None
+    published_from: Optional[str] = None
+    published_to: Optional[str] = None
+    sort: Optional[str] = None
+
+class QueryPlan(BaseModel):
+    sql: str
+    plan: List[str]
+    full_scan: bool
+
+class ProfilingSettings(BaseModel):
+    # Unset fields keep their current value
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = Field(None, ge=0, le=1)
+    slow_request_ms: Optional[float] = Field(None, ge=0)
+    mode: Optional[Literal["stack", "cprofile"]] = None
+    interval_ms: Optional[float] = Field(None, ge=0.5)
+    max_files: Optional[int] = Field(None, ge=1)
+    # 0 turns the slow-query log off
+    slow_query_ms: Optional[float] = Field(None, ge=0)
+    explain: Optional[bool] = None
 
 class Token(BaseModel):
     access_token: str
@@ -32,5 +138,4 @@ class User(UserBase):
     id: int
     is_active: bool
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
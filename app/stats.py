@@ -0,0 +1,155 @@
+# app/stats.py
+"""Catalog aggregates: book counts per genre, per author and in total.
+
+crud adjusts the book_stats table by deltas inside each write transaction,
+so reads cost a handful of indexed lookups however large the catalog is.
+Writes that bypass crud (raw SQL, restores) can make it drift; check and
+repair it with
+
+    python -m app.stats verify
+    python -m app.stats rebuild
+"""
+import asyncio
+import importlib
+import sys
+from collections import Counter
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+TOTAL = ("total", "")
+# Dialect -> module whose insert() has an upsert form; imported on first use,
+# the postgresql dialect alone adds ~15ms to every cold start. Others fall
+# back to UPDATE, then INSERT for keys that had no row.
+UPSERT_DIALECTS = {"sqlite": "sqlite", "postgresql": "postgresql", "mysql": "mysql", "mariadb": "mysql"}
+
+stats_table = models.BookStat.__table__
+
+
+def book_deltas(book: dict, sign: int = 1, deltas: Counter | None = None) -> Counter:
+    # Adds (or with sign=-1 removes) one book's contribution; an update is
+    # the old row removed plus the new one added, which nets to zero unless
+    # the genre or author changed
+    deltas = deltas if deltas is not None else Counter()
+    deltas[TOTAL] += sign
+    deltas[("genre", book["genre"])] += sign
+    deltas[("author", book["author"])] += sign
+    return deltas
+
+
+def upsert_query(dialect: str):
+    # One statement adding each delta to its row, creating rows as needed
+    module = UPSERT_DIALECTS.get(dialect)
+    if module is None:
+        return None
+    query = importlib.import_module(f"sqlalchemy.dialects.{module}").insert(stats_table)
+    if module == "mysql":
+        return query.on_duplicate_key_update(count=stats_table.c.count + query.inserted.count)
+    return query.on_conflict_do_update(
+        index_elements=["kind", "name"], set_={"count": stats_table.c.count + query.excluded.count}
+    )
+
+
+async def adjust(db: AsyncSession, deltas: Counter):
+    """Apply deltas in the caller's transaction: one upsert for all touched keys."""
+    changes = [{"kind": kind, "name": name, "count": delta} for (kind, name), delta in deltas.items() if delta]
+    if not changes:
+        return
+    # Genres and authors left without books stay behind at 0 (reads skip
+    # them, rebuild drops them) rather than costing a DELETE per write
+    query = upsert_query(db.bind.dialect.name)
+    if query is not None:
+        await db.execute(query, changes)
+        return
+    for change in changes:
+        result = await db.execute(
+            update(stats_table)
+            .where(stats_table.c.kind == change["kind"], stats_table.c.name == change["name"])
+            .values(count=stats_table.c.count + change["count"])
+        )
+        if not result.rowcount:
+            await db.execute(stats_table.insert(), change)
+
+
+async def get_stats(db: AsyncSession, authors_limit: int) -> dict:
+    def counts(kind: str, limit: int | None = None):
+        query = (
+            select(stats_table.c.name, stats_table.c.count)
+            .where(stats_table.c.kind == kind, stats_table.c.count > 0)
+            .order_by(stats_table.c.count.desc(), stats_table.c.name)
+        )
+        return query.limit(limit) if limit is not None else query
+
+    total = (await db.execute(select(stats_table.c.count).where(stats_table.c.kind == "total"))).scalar()
+    genres = (await db.execute(counts("genre"))).all()
+    authors = (await db.execute(counts("author", authors_limit))).all()
+    distinct_authors = (await db.execute(
+        select(func.count()).select_from(stats_table).where(stats_table.c.kind == "author", stats_table.c.count > 0)
+    )).scalar()
+    return {
+        "total": total or 0,
+        "genres": dict(genres),
+        "authors": dict(authors),
+        "distinct_authors": distinct_authors,
+    }
+
+
+async def compute(db: AsyncSession) -> Counter:
+    # The expensive way: full scans of books
+    books = models.Book.__table__
+    counts = Counter({TOTAL: (await db.execute(select(func.count()).select_from(books))).scalar()})
+    for kind, column in (("genre", books.c.genre), ("author", books.c.author)):
+        for name, count in await db.execute(select(column, func.count()).group_by(column)):
+            counts[(kind, name)] = count
+    return counts
+
+
+async def verify(db: AsyncSession) -> list[tuple]:
+    """Returns (kind, name, stored, actual) for every count that has drifted."""
+    actual = await compute(db)
+    stored = Counter({(kind, name): count for kind, name, count in await db.execute(select(stats_table)) if count})
+    return [
+        (kind, name, stored[(kind, name)], actual[(kind, name)])
+        for kind, name in sorted(stored.keys() | actual.keys())
+        if stored[(kind, name)] != actual[(kind, name)]
+    ]
+
+
+async def rebuild(db: AsyncSession):
+    # One transaction: readers see the old counts or the new ones, never none
+    counts = await compute(db)
+    await db.execute(delete(stats_table))
+    await db.execute(stats_table.insert(), [
+        {"kind": kind, "name": name, "count": count} for (kind, name), count in counts.items() if count or kind == "total"
+    ])
+    await db.commit()
+
+
+async def ensure(db: AsyncSession):
+    # A database created before book_stats existed has no total row yet
+    result = await db.execute(select(stats_table.c.count).where(stats_table.c.kind == "total"))
+    if result.first() is None:
+        await rebuild(db)
+
+
+async def main(command: str) -> int:
+    from app.db import WriteSessionLocal
+
+    async with WriteSessionLocal() as db:
+        if command == "rebuild":
+            await rebuild(db)
+            print("book_stats rebuilt")
+            return 0
+        drift = await verify(db)
+    for kind, name, stored, actual in drift:
+        print(f"{kind:6} {name!r}: stored {stored}, actual {actual}")
+    print("book_stats is consistent" if not drift else f"{len(drift)} counts differ; run `python -m app.stats rebuild`")
+    return 1 if drift else 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in (["verify"], ["rebuild"]):
+        sys.exit("Usage: python -m app.stats verify|rebuild")
+    sys.exit(asyncio.run(main(sys.argv[1])))
@@ -1,9 +1,195 @@
+import asyncio
+import base64
+import codecs
+import csv
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+
+from decouple import config
 from passlib.context import CryptContext
 
+from app.metrics import password_duration
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt runs on its own small pool so a burst of logins cannot take over the
+# default threadpool or the event loop. At most PASSWORD_MAX_PENDING checks may
+# be running or queued; beyond that new ones are turned away immediately.
+PASSWORD_WORKERS = config("PASSWORD_WORKERS", default=2, cast=int)
+PASSWORD_MAX_PENDING = config("PASSWORD_MAX_PENDING", default=16, cast=int)
+_password_pool = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+_password_pending = 0
+
+class PasswordPoolBusy(Exception):
+    """Too many password hashes/checks are already in flight."""
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+_hash_timing = password_duration.labels("hash")
+_verify_timing = password_duration.labels("verify")
+
+def password_pending() -> int:
+    return _password_pending
+
+async def run_password_task(fn, *args, timing: list | None = None):
+    global _password_pending
+    if _password_pending >= PASSWORD_MAX_PENDING:
+        raise PasswordPoolBusy()
+    _password_pending += 1
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_pool, fn, *args)
+    finally:
+        _password_pending -= 1
+        if timing is not None:
+            password_duration.observe(time.perf_counter() - start, timing)
+
+async def hash_password_async(password: str) -> str:
+    return await run_password_task(hash_password, password, timing=_hash_timing)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_task(verify_password, plain_password, hashed_password, timing=_verify_timing)
+
+def book_etag(book_id: int, version: int) -> str:
+    return f'"{book_id}-{version}"'
+
+def list_etag(rows, has_more: bool = False, fields: tuple = ()) -> str:
+    # Strong ETag over the (id, version) pairs of a page: any edit, insert or
+    # delete that touches the page changes it. Each field selection is its own
+    # representation, so it gets its own tag.
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(",".join(fields).encode())
+    for book_id, version in rows:
+        digest.update(f"{book_id}:{version};".encode())
+    digest.update(b"+" if has_more else b".")
+    return f'"{digest.hexdigest()}"'
+
+def content_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def parse_etags(header: str | None) -> list[str] | None:
+    # Returns None when the header is absent, ["*"] for a wildcard
+    if header is None:
+        return None
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+def etag_matches(tags: list[str], etag: str) -> bool:
+    # Weak comparison, as required for If-None-Match
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+def etag_versions(tags: list[str], book_id: int) -> set[int]:
+    # Versions named by If-Match tags for this book; other books' tags are
+    # ignored. Tags made weak by compression still name an exact version.
+    versions = set()
+    for tag in tags:
+        book, _, version = tag.removeprefix("W/").strip('"').partition("-")
+        if book == str(book_id) and version.isdigit():
+            versions.add(int(version))
+    return versions
+
+def fts_query(q: str) -> str:
+    # Quote every term so user input cannot inject FTS5 operators; a trailing
+    # '*' on a term is kept as a prefix query.
+    terms = []
+    for term in q.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+def parse_fields(value: str, allowed: tuple) -> tuple:
+    # "id,title" -> ("id", "title"), in the requested order without repeats
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    if not fields:
+        raise ValueError("No fields requested")
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}; choose from {', '.join(allowed)}")
+    return fields
+
+def row_dicts(fields: tuple, rows) -> list[dict]:
+    # zip stops at the shorter side, so trailing internal columns are left out
+    return [dict(zip(fields, row)) for row in rows]
+
+def encode_cursor(order: str, key: tuple) -> str:
+    raw = json.dumps([order, *key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, order: str) -> tuple:
+    # Raises ValueError for tokens that are malformed or were issued for another ordering
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_order, *key = json.loads(raw)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if cursor_order != order:
+        raise ValueError("Cursor does not match requested order")
+    if order == "title":
+        if len(key) != 2 or not isinstance(key[0], str) or not isinstance(key[1], int):
+            raise ValueError("Invalid cursor")
+    elif len(key) != 1 or not isinstance(key[0], int):
+        raise ValueError("Invalid cursor")
+    return tuple(key)
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Split a streamed body into text lines without buffering the whole body.
+    # Incremental decoding: a multi-byte character may straddle two chunks.
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    # Raises UnicodeDecodeError if the body ends inside a character
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, object]]:
+    # Yields (line number, parsed object or ValueError) so one bad line never aborts the import
+    line_no = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"Invalid JSON: {e}")
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, object]]:
+    # First line is the header. Quoted fields may span lines, so keep joining
+    # physical lines while the quote count is odd.
+    header = None
+    pending = ""
+    line_no = 0
+    record_line = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if not pending:
+            record_line = line_no
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield record_line, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        yield record_line, {key: value if value != "" else None for key, value in zip(header, values)}
+    if pending:
+        yield record_line, ValueError("Unterminated quoted field")
@@ -0,0 +1,5 @@
+import os
+
+# Benchmarks are load generators: per-client rate limits would turn every
+# run into a test of the 429 path. Set RATE_LIMIT_ENABLED=true to measure it.
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
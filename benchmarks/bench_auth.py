@@ -0,0 +1,43 @@
+"""Per-request authentication overhead: JWT verification and bcrypt.
+
+Usage: python -m benchmarks.bench_auth
+"""
+import asyncio
+import time
+
+from app import auth, utils
+
+ITERATIONS = 20_000
+BCRYPT_ITERATIONS = 16
+
+
+def per_call_us(fn, iterations) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) * 1_000_000 / iterations
+
+
+async def bcrypt_throughput(hashed: str) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*[utils.verify_password_async("bench", hashed) for _ in range(BCRYPT_ITERATIONS)])
+    return BCRYPT_ITERATIONS / (time.perf_counter() - start)
+
+
+def main():
+    token = auth.create_access_token({"sub": "bench"})
+
+    def uncached():
+        auth._token_cache.clear()
+        auth.verify_token(token)
+
+    print(f"verify_token (jwt.decode): {per_call_us(uncached, ITERATIONS):8.2f} us/call")
+    print(f"verify_token (cached):     {per_call_us(lambda: auth.verify_token(token), ITERATIONS):8.2f} us/call")
+
+    hashed = utils.hash_password("bench")
+    print(f"bcrypt verify (inline):    {per_call_us(lambda: utils.verify_password('bench', hashed), 4) / 1000:8.2f} ms/call")
+    print(f"bcrypt verify (pool of {utils.PASSWORD_WORKERS}): {asyncio.run(bcrypt_throughput(hashed)):8.2f} checks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Bytes on the wire and CPU per request with and without compression.
+
+Runs the app in-process against a scratch database whose books have
+summaries, so full listings look like real ones. CPU is process time per
+request (event loop plus database threads), which is what a worker spends
+whether or not the client is slow to read.
+
+Usage: python -m benchmarks.bench_compression [books]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+SAMPLES = 50
+URLS = [
+    "/books/1",
+    "/books/?limit=20",
+    "/books/?limit=100",
+    "/books/?limit=100&fields=id,title,author,published_date,summary,genre",
+    "/books/export",
+]
+
+
+async def measure(app, url, headers) -> tuple[str, int, float]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        size = 0
+        start = time.process_time()
+        for _ in range(SAMPLES):
+            # Raw bytes, as they would cross the network
+            async with client.stream("GET", url, headers=headers) as response:
+                encoding = response.headers.get("content-encoding", "identity")
+                size = 0
+                async for chunk in response.aiter_raw():
+                    size += len(chunk)
+        return encoding, size, (time.process_time() - start) * 1000 / SAMPLES
+
+
+async def main(books: int):
+    # Compression is added per configuration below, not by the app itself
+    os.environ["COMPRESSION_ENABLED"] = "false"
+    from app import compression
+    from app.main import app
+
+    configs = {"identity": (app, "identity")}
+    for level in (1, 6, 9):
+        configs[f"gzip-{level}"] = (compression.CompressionMiddleware(app, gzip_level=level, enabled=True), "gzip")
+    if compression.brotli is not None:
+        for level in (4, 11):
+            configs[f"br-{level}"] = (compression.CompressionMiddleware(app, brotli_level=level, enabled=True), "br")
+
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not run the lifespan, which creates the schema
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/users/", json={"username": "bench", "password": "bench"})
+        token = (await client.post("/login", data={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        body = "".join(
+            f'{{"title": "Book {i}", "author": "Author {i % 50}", "genre": "Genre {i % 7}", '
+            f'"published_date": "19{i % 100:02}-01-01", "summary": "Summary of book {i}: {"lorem ipsum " * 20}"}}\n'
+            for i in range(books)
+        )
+        await client.post("/books/bulk", content=body, headers={**headers, "Content-Type": "application/x-ndjson"})
+
+    if compression.brotli is None:
+        print("brotli is not installed: only gzip is measured")
+    for url in URLS:
+        print(url)
+        baseline = None
+        for name, (target, accept) in configs.items():
+            encoding, size, cpu_ms = await measure(target, url, {**headers, "Accept-Encoding": accept})
+            baseline = baseline or size
+            print(f"  {name:9} {encoding:8} {size:9} B ({size / baseline:6.1%})  cpu={cpu_ms:7.2f}ms/request")
+
+
+if __name__ == "__main__":
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app opens ./books.db, so run it from a scratch directory
+        os.chdir(tmp)
+        asyncio.run(main(books))
@@ -0,0 +1,60 @@
+"""Measure bytes and latency saved by conditional GETs (If-None-Match -> 304).
+
+Runs the app in-process against a scratch database.
+
+Usage: python -m benchmarks.bench_conditional [books]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+SAMPLES = 200
+
+
+async def measure(client, url, headers):
+    latencies = []
+    size = 0
+    status = None
+    for _ in range(SAMPLES):
+        start = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        size = len(response.content)
+        status = response.status_code
+    return status, size, statistics.median(latencies)
+
+
+async def main(books: int):
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not run the lifespan, which creates the schema
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/users/", json={"username": "bench", "password": "bench"})
+        token = (await client.post("/login", data={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        body = "".join(
+            f'{{"title": "Book {i}", "author": "Author {i % 50}", "genre": "Genre {i % 7}", "summary": "{"lorem ipsum " * 40}"}}\n'
+            for i in range(books)
+        )
+        await client.post("/books/bulk", content=body, headers={**headers, "Content-Type": "application/x-ndjson"})
+
+        for url in ["/books/1", "/books/?limit=100", "/books/?limit=100&skip=500", "/books/?after=&limit=100"]:
+            etag = (await client.get(url, headers=headers)).headers["etag"]
+            full = await measure(client, url, headers)
+            cond = await measure(client, url, {**headers, "If-None-Match": etag})
+            print(f"{url:28} 200: {full[1]:7} B {full[2]:6.2f}ms   {cond[0]}: {cond[1]:3} B {cond[2]:6.2f}ms")
+
+
+if __name__ == "__main__":
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app opens ./books.db, so run it from a scratch directory
+        os.chdir(tmp)
+        asyncio.run(main(books))
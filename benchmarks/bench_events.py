@@ -0,0 +1,74 @@
+"""Cost of EventManager.emit with many connected SSE listeners.
+
+Nobody drains the buffers, so after the first SSE_BUFFER_SIZE events every
+emit also exercises the overflow policy.
+
+The filtered runs connect the same number of listeners, each following one
+book, one author or one genre, so an emit only reaches a few of them.
+
+Usage: python -m benchmarks.bench_events [listeners]
+"""
+import asyncio
+import sys
+import time
+
+from app.events import OVERFLOW_POLICIES, EventFilter, EventManager
+
+EMITS = 500
+BOOKS = 50
+AUTHORS = 200
+GENRES = 20
+
+FILTERS = {
+    "none": lambda i: None,
+    "book_id": lambda i: EventFilter(book_ids=[i]),
+    "author": lambda i: EventFilter(authors=[f"Author {i % AUTHORS}"]),
+    "genre+type": lambda i: EventFilter(types=["book_deleted"], genres=[f"Genre {i % GENRES}"]),
+}
+
+
+async def emit_all(manager: EventManager) -> float:
+    start = time.perf_counter()
+    for i in range(EMITS):
+        await manager.emit("book_updated", {
+            "id": i % BOOKS,
+            "title": f"Book {i}",
+            "author": f"Author {i % AUTHORS}",
+            "genre": f"Genre {i % GENRES}",
+        })
+    return time.perf_counter() - start
+
+
+async def run(listeners: int, policy: str):
+    manager = EventManager(buffer_size=64, overflow_policy=policy)
+    for _ in range(listeners):
+        await manager.register()
+    elapsed = await emit_all(manager)
+    stats = manager.stats(top=1)
+    print(
+        f"{listeners:>6} listeners  policy={policy:11}  emit={elapsed * 1000 / EMITS:8.3f}ms  "
+        f"per listener={elapsed * 1e9 / EMITS / listeners:6.0f}ns  "
+        f"still connected={stats['listeners']}  disconnected={stats['disconnected']}"
+    )
+
+
+async def run_filtered(listeners: int, name: str):
+    manager = EventManager(buffer_size=64)
+    make_filter = FILTERS[name]
+    for i in range(listeners):
+        await manager.register(event_filter=make_filter(i))
+    elapsed = await emit_all(manager)
+    received = sum(subscriber.delivered + len(subscriber.buffer) + subscriber.dropped
+                   for subscriber in manager.listeners.values())
+    print(
+        f"{listeners:>6} listeners  filter={name:10}  emit={elapsed * 1000 / EMITS:8.3f}ms  "
+        f"recipients per emit={received / EMITS:8.1f}"
+    )
+
+
+if __name__ == "__main__":
+    listeners = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    for policy in OVERFLOW_POLICIES:
+        asyncio.run(run(listeners, policy))
+    for name in FILTERS:
+        asyncio.run(run_filtered(listeners, name))
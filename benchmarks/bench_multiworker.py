@@ -0,0 +1,116 @@
+"""Check cross-worker SSE delivery with the sqlite event bus under real uvicorn.
+
+Starts uvicorn with several workers on a scratch database, connects SSE
+clients (spread over the workers by the kernel), sends writes through fresh
+connections and verifies every client receives every event, in sequence
+order. Exits non-zero on failure.
+
+Usage: python -m benchmarks.bench_multiworker [workers] [writes]
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+PORT = 8765
+BASE_URL = f"http://127.0.0.1:{PORT}"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def wait_until_up(timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=BASE_URL) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get("/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not start")
+
+
+async def listen(ready: asyncio.Event, expected: int, received: list):
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=None) as client:
+        async with client.stream("GET", "/stream/data") as response:
+            ready.set()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = httpx.Response(200, content=line[6:]).json()
+                received.append((datetime.utcnow(), event))
+                if len(received) >= expected:
+                    return
+
+
+async def run(workers: int, writes: int) -> bool:
+    await wait_until_up()
+    # No keep-alive, so writes land on different workers
+    limits = httpx.Limits(max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=BASE_URL, limits=limits) as client:
+        await client.post("/users/", json={"username": "bench", "password": "bench"})
+        token = (await client.post("/login", data={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        listeners = workers * 3
+        readies = [asyncio.Event() for _ in range(listeners)]
+        received = [[] for _ in range(listeners)]
+        tasks = [asyncio.create_task(listen(readies[i], writes, received[i])) for i in range(listeners)]
+        await asyncio.gather(*(ready.wait() for ready in readies))
+        await asyncio.sleep(0.5)
+
+        for i in range(writes):
+            await client.post("/books/", json={"title": f"Book {i}", "author": "Bench", "genre": "Load"}, headers=headers)
+        try:
+            await asyncio.wait_for(asyncio.gather(*tasks), timeout=30)
+        except asyncio.TimeoutError:
+            pass
+
+    ok = True
+    latencies = []
+    for i, events in enumerate(received):
+        seqs = [event["seq"] for _, event in events]
+        if len(seqs) != writes or seqs != sorted(seqs):
+            print(f"listener {i}: got {len(seqs)}/{writes} events, ordered={seqs == sorted(seqs)}")
+            ok = False
+        latencies += [(at - datetime.fromisoformat(event["timestamp"])).total_seconds() * 1000 for at, event in events]
+    if latencies:
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"{workers} workers, {listeners} listeners, {writes} writes: "
+              f"delivery p50={quantiles[49]:.1f}ms p99={quantiles[98]:.1f}ms")
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def main(workers: int, writes: int) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "PYTHONPATH": ROOT,
+            "EVENT_BACKEND": "sqlite",
+            "EVENT_BUS_PATH": os.path.join(tmp, "events.db"),
+            "SECRET_KEY": "bench-multiworker",
+        }
+        # Migrate once so workers do not race on the schema
+        subprocess.run([sys.executable, "-m", "app.migrations", "upgrade"], cwd=tmp, env=env, check=True)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=tmp, env=env,
+        )
+        try:
+            return 0 if asyncio.run(run(workers, writes)) else 1
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    writes = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    sys.exit(main(workers, writes))
@@ -0,0 +1,67 @@
+"""Compare OFFSET paging with keyset paging on synthetic catalogs.
+
+Usage: python -m benchmarks.bench_pagination [rows ...]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import crud, models
+
+PAGE_SIZE = 50
+SAMPLES = 20
+
+
+def seed(engine, rows: int):
+    models.Base.metadata.create_all(bind=engine)
+    batch = 10_000
+    with engine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(models.Book.__table__.insert(), [
+                {
+                    "title": f"Title {i:08d}",
+                    "author": f"Author {i % 997}",
+                    "published_date": "2024-01-01",
+                    "summary": "lorem ipsum " * 8,
+                    "genre": f"Genre {i % 13}",
+                }
+                for i in range(start, min(start + batch, rows))
+            ])
+
+
+async def time_ms(fn) -> float:
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        await fn()
+    return (time.perf_counter() - start) * 1000 / SAMPLES
+
+
+async def run(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(create_engine(f"sqlite:///{path}"), rows)
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        async with async_sessionmaker(bind=engine)() as db:
+            # Deepest page is where OFFSET hurts the most
+            skip = max(rows - PAGE_SIZE, 0)
+            last = (await crud.get_books(db, skip=skip, limit=1))[0]
+            last_id, last_title = last.id, last.title
+
+            results = {
+                "offset": await time_ms(lambda: crud.get_books(db, skip=skip, limit=PAGE_SIZE)),
+                "keyset_id": await time_ms(lambda: crud.get_books_after(db, (last_id - 1,), PAGE_SIZE)),
+                "keyset_title": await time_ms(lambda: crud.get_books_after(db, (last_title, last_id - 1), PAGE_SIZE, order="title")),
+            }
+        await engine.dispose()
+    print(f"{rows:>9} rows  " + "  ".join(f"{name}={ms:8.3f}ms" for name, ms in results.items()))
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000, 1_000_000]
+    for size in sizes:
+        asyncio.run(run(size))
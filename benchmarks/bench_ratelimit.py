@@ -0,0 +1,80 @@
+"""Rate limiter overhead per request, and the shared backend across processes.
+
+Times RateLimiter.check for the local and shared backends with many
+distinct clients, and client_key for a request with a cached JWT. Then
+several processes drain one bucket of the shared backend at once: they
+should be granted burst + rate * seconds requests between them, not that
+many each.
+
+Usage: python -m benchmarks.bench_ratelimit [clients] [processes]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from app import auth, ratelimit
+
+CHECKS = 200_000
+RATE, BURST = 10.0, 20.0
+DRAIN_SECONDS = 2.0
+
+
+def per_check_us(limiter, clients: int) -> float:
+    keys = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(clients)]
+    start = time.perf_counter()
+    for i in range(CHECKS):
+        limiter.check("read", keys[i % clients])
+    return (time.perf_counter() - start) * 1_000_000 / CHECKS
+
+
+def drain(path: str, start: float, granted):
+    # time.monotonic is system-wide, so every process drains the same window
+    backend = ratelimit.SharedBackend(path)
+    time.sleep(max(0.0, start - time.monotonic()))
+    deadline = start + DRAIN_SECONDS
+    count = 0
+    while time.monotonic() < deadline:
+        if not backend.take("read:ip:10.0.0.1", RATE, BURST):
+            count += 1
+    granted.put(count)
+
+
+def main(clients: int, processes: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ratelimit.bin")
+        backends = {
+            "local": ratelimit.LocalBackend(),
+            "shared": ratelimit.SharedBackend(path),
+        }
+        for name, backend in backends.items():
+            limiter = ratelimit.RateLimiter(backend, enabled=True)
+            print(f"check ({name:6}, {clients} clients): {per_check_us(limiter, clients):6.2f} us")
+
+        token = auth.create_access_token({"sub": "bench"})
+        scope = {"headers": [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())],
+                 "client": ("127.0.0.1", 1234)}
+        start = time.perf_counter()
+        for _ in range(CHECKS):
+            ratelimit.client_key(scope)
+        print(f"client_key (cached JWT):   {(time.perf_counter() - start) * 1_000_000 / CHECKS:6.2f} us")
+
+        path = os.path.join(tmp, "drain.bin")
+        granted = multiprocessing.Queue()
+        start = time.monotonic() + 1.0
+        workers = [multiprocessing.Process(target=drain, args=(path, start, granted)) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        counts = [granted.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        expected = BURST + RATE * DRAIN_SECONDS
+        print(f"{processes} processes sharing one bucket for {DRAIN_SECONDS}s: granted {sum(counts)} "
+              f"({counts}), expected about {expected:.0f}")
+
+
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    main(clients, processes)
@@ -0,0 +1,76 @@
+"""Compare FTS5 search with a LIKE '%q%' scan on synthetic catalogs.
+
+Usage: python -m benchmarks.bench_search [rows ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+from app import models, utils
+from app.crud import SEARCH_SQL
+
+WORDS = (
+    "dragon empire river shadow garden winter machine ocean silent crown "
+    "forest letter mountain stranger harbor glass journey secret island storm"
+).split()
+# Rare terms appear in roughly 0.1% of rows, like most real search terms
+RARE = ["zephyr", "quixotic", "labyrinth", "obsidian"]
+QUERIES = ["zephyr", "quixotic labyrinth", "obsid*"]
+SAMPLES = 10
+
+
+def seed(engine, rows: int):
+    rng = random.Random(42)
+    models.Base.metadata.create_all(bind=engine)
+    batch = 10_000
+    with engine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(models.Book.__table__.insert(), [
+                {
+                    "title": " ".join(rng.choices(WORDS, k=3)).title(),
+                    "author": f"Author {i % 997}",
+                    "published_date": "2024-01-01",
+                    "summary": " ".join(rng.choices(WORDS, k=20) + [w for w in RARE if rng.random() < 0.001]),
+                    "genre": f"Genre {i % 13}",
+                }
+                for i in range(start, min(start + batch, rows))
+            ])
+
+
+def time_ms(conn, sql, params) -> float:
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        conn.execute(text(sql), params).fetchall()
+    return (time.perf_counter() - start) * 1000 / SAMPLES
+
+
+def run(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed(engine, rows)
+        with engine.connect() as conn:
+            for q in QUERIES:
+                like = q.rstrip("*")
+                fts = time_ms(conn, str(SEARCH_SQL), {"query": utils.fts_query(q), "limit": 20, "skip": 0})
+                # Every term must match somewhere, like the FTS5 implicit AND
+                where = " AND ".join(
+                    f"(title LIKE :q{i} OR author LIKE :q{i} OR summary LIKE :q{i} OR genre LIKE :q{i})"
+                    for i in range(len(like.split()))
+                )
+                scan = time_ms(
+                    conn,
+                    f"SELECT id, title FROM books WHERE {where} LIMIT 20",
+                    {f"q{i}": f"%{term}%" for i, term in enumerate(like.split())},
+                )
+                print(f"{rows:>9} rows  q={q!r:22} fts5={fts:9.3f}ms  like={scan:9.3f}ms")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,105 @@
+"""Cost of fetching and serializing book listings, per 1k rows.
+
+"orm" is the previous GET /books/ path: ORM objects, FastAPI's
+response_model validation and serialization against list[schemas.Book],
+then JSONResponse's json.dumps. "rows" selects the same fields as column
+tuples, zips them into dicts and encodes them with pydantic-core's to_json;
+"rows+json" swaps in the stdlib encoder to separate the encoder from the
+rest. "compact" is what GET /books/ now returns by default: the same path
+without the summary column.
+
+Usage: python -m benchmarks.bench_serialization [rows per page ...]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic_core import to_json
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import crud, models, schemas, utils
+from benchmarks.seed import seed
+
+BOOKS = 20_000
+SAMPLES = 20
+
+response_field = create_model_field(name="Response_read_books", type_=list[schemas.Book], mode="serialization")
+
+
+async def fetch_orm(db, limit):
+    result = await db.execute(select(models.Book).limit(limit))
+    books = result.scalars().all()
+    # Fresh identity map per page, as in a request
+    db.expunge_all()
+    return books
+
+
+async def encode_orm(books):
+    content = await serialize_response(field=response_field, response_content=books)
+    return JSONResponse(content).body
+
+
+async def fetch_rows(db, limit):
+    return await crud.get_books(db, skip=0, limit=limit, fields=crud.BOOK_FIELDS)
+
+
+async def encode_rows(rows):
+    return to_json(utils.row_dicts(crud.BOOK_FIELDS, rows))
+
+
+async def fetch_compact(db, limit):
+    return await crud.get_books(db, skip=0, limit=limit)
+
+
+async def encode_compact(rows):
+    return to_json(utils.row_dicts(crud.LIST_FIELDS, rows))
+
+
+async def encode_rows_json(rows):
+    # Same settings as JSONResponse
+    return json.dumps(utils.row_dicts(crud.BOOK_FIELDS, rows), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+async def time_ms(fn, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        result = await fn(*args)
+    return (time.perf_counter() - start) * 1000 / SAMPLES, result
+
+
+async def run(limit: int, path: str):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with async_sessionmaker(bind=engine, expire_on_commit=False)() as db:
+        per_1k = 1000 / limit
+        paths = {
+            "orm": (fetch_orm, encode_orm),
+            "rows": (fetch_rows, encode_rows),
+            "rows+json": (fetch_rows, encode_rows_json),
+            "compact": (fetch_compact, encode_compact),
+        }
+        results = {}
+        for name, (fetch, encode) in paths.items():
+            fetch_ms, page = await time_ms(fetch, db, limit)
+            encode_ms, body = await time_ms(encode, page)
+            results[name] = (fetch_ms * per_1k, encode_ms * per_1k, len(body))
+    await engine.dispose()
+    print(f"page of {limit} rows, per 1k rows:")
+    for name, (fetch_ms, encode_ms, size) in results.items():
+        print(f"  {name:10} fetch={fetch_ms:7.2f}ms  serialize={encode_ms:7.2f}ms  "
+              f"total={fetch_ms + encode_ms:7.2f}ms  body={size} bytes")
+
+
+if __name__ == "__main__":
+    limits = [int(arg) for arg in sys.argv[1:]] or [100, 1_000]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, BOOKS)
+        for limit in limits:
+            asyncio.run(run(limit, path))
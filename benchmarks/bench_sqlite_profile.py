@@ -0,0 +1,119 @@
+"""Concurrent reads and writes under the tuned and the default SQLite profile.
+
+Each profile runs in its own process (SQLITE_PROFILE is read at import)
+against a scratch database. Readers page through GET /books/ with cursors,
+which skips the read cache, while writers update random books. Reports
+latency percentiles, throughput and failed requests ("database is locked"
+surfaces as a 500).
+
+Usage: python -m benchmarks.bench_sqlite_profile [seconds] [readers] [writers]
+"""
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BOOKS = 5_000
+PROFILES = ("default", "tuned")
+
+
+def pct(samples, q):
+    if not samples:
+        return 0.0
+    return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+
+async def worker(client, headers, deadline, request, latencies, failures):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await request(client, headers)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        if ok:
+            latencies.append((time.perf_counter() - start) * 1000)
+        else:
+            failures.append(1)
+
+
+async def read(client, headers):
+    return await client.get("/books/", params={"after": "", "limit": 20}, headers=headers)
+
+
+async def write(client, headers):
+    book_id = random.randint(1, BOOKS)
+    book = {"title": f"Book {book_id}", "author": f"Author {book_id % 100}", "genre": "Bench"}
+    return await client.put(f"/books/{book_id}", json=book, headers=headers)
+
+
+async def child(seconds: float, readers: int, writers: int):
+    from app import db, migrations, models
+    from app.main import app
+
+    migrations.ensure(db.engine)
+    with db.engine.begin() as connection:
+        connection.execute(models.Book.__table__.insert(), [
+            {"title": f"Book {i}", "author": f"Author {i % 100}", "genre": "Bench"} for i in range(BOOKS)
+        ])
+
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not run the lifespan; enter it so the outbox relay batches its marks
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        await client.post("/users/", json={"username": "bench", "password": "bench"})
+        token = (await client.post("/login", data={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        read_latencies, write_latencies, read_failures, write_failures = [], [], [], []
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(
+            *(worker(client, headers, deadline, read, read_latencies, read_failures) for _ in range(readers)),
+            *(worker(client, headers, deadline, write, write_latencies, write_failures) for _ in range(writers)),
+        )
+    print(json.dumps({
+        "reads_per_s": len(read_latencies) / seconds,
+        "read_p50": pct(read_latencies, 50),
+        "read_p99": pct(read_latencies, 99),
+        "read_failures": len(read_failures),
+        "writes_per_s": len(write_latencies) / seconds,
+        "write_p50": pct(write_latencies, 50),
+        "write_p99": pct(write_latencies, 99),
+        "write_failures": len(write_failures),
+    }))
+
+
+def run(profile: str, seconds: float, readers: int, writers: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app opens ./books.db, so run it from a scratch directory
+        env = {**os.environ, "SQLITE_PROFILE": profile, "PYTHONPATH": os.getcwd()}
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_sqlite_profile", "--child", str(seconds), str(readers), str(writers)],
+            cwd=tmp, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        seconds, readers, writers = float(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+        asyncio.run(child(seconds, readers, writers))
+        sys.exit()
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    writers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    print(f"{readers} readers, {writers} writers, {seconds:.0f}s per profile")
+    for profile in PROFILES:
+        r = run(profile, seconds, readers, writers)
+        print(
+            f"{profile:8} reads {r['reads_per_s']:7.1f}/s p50={r['read_p50']:7.2f}ms p99={r['read_p99']:8.2f}ms "
+            f"failed={r['read_failures']:<4} | writes {r['writes_per_s']:6.1f}/s p50={r['write_p50']:7.2f}ms "
+            f"p99={r['write_p99']:8.2f}ms failed={r['write_failures']}"
+        )
@@ -0,0 +1,103 @@
+"""Cold start: importing app.main and running its startup, in fresh processes.
+
+Each run is a new interpreter started with -X importtime against an
+already migrated scratch database, like a serverless or autoscaled
+instance coming up. Reports the median import and lifespan startup times,
+the packages that dominate the import and the slowest app modules. Exits
+1 when import plus startup exceeds --budget-ms.
+
+Usage: python -m benchmarks.bench_startup [--runs 5] [--budget-ms 1000] [--top 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child():
+    start = time.perf_counter()
+    from app.main import app
+
+    imported = time.perf_counter()
+
+    async def startup():
+        async with app.router.lifespan_context(app):
+            return time.perf_counter()
+
+    started = asyncio.run(startup())
+    print(json.dumps({"import_ms": (imported - start) * 1000, "startup_ms": (started - imported) * 1000}))
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    # "import time: self [us] | cumulative | imported package" lines
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def run_once(workdir: str, env: dict) -> tuple[dict, float, list]:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-m", "benchmarks.bench_startup", "--child"],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    return json.loads(result.stdout.strip().splitlines()[-1]), wall_ms, parse_importtime(result.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="fail when median import + startup exceeds this")
+    parser.add_argument("--top", type=int, default=10, help="packages and app modules to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, "PYTHONPATH": ROOT}
+        # Migrate first: the runs should measure a routine start, not schema creation
+        subprocess.run([sys.executable, "-m", "app.migrations", "upgrade"], cwd=workdir, env=env, check=True,
+                       capture_output=True)
+        runs = [run_once(workdir, env) for _ in range(args.runs)]
+
+    import_ms = statistics.median(timing["import_ms"] for timing, _, _ in runs)
+    startup_ms = statistics.median(timing["startup_ms"] for timing, _, _ in runs)
+    wall_ms = statistics.median(wall for _, wall, _ in runs)
+    print(f"{args.runs} runs, median: import={import_ms:.0f}ms  startup={startup_ms:.0f}ms  "
+          f"process={wall_ms:.0f}ms (with interpreter start and shutdown; -X importtime adds overhead)")
+
+    # Self time summed per top-level package, from the last run
+    modules = runs[-1][2]
+    packages = Counter()
+    for name, self_us, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    print("import self time by package:")
+    for package, self_us in packages.most_common(args.top):
+        print(f"  {package:24} {self_us / 1000:7.1f}ms")
+    print("app modules by cumulative import time:")
+    app_modules = sorted((m for m in modules if m[0].startswith("app.")), key=lambda m: -m[2])
+    for name, self_us, cumulative_us in app_modules[:args.top]:
+        print(f"  {name:24} {cumulative_us / 1000:7.1f}ms  (self {self_us / 1000:.1f}ms)")
+
+    if args.budget_ms is not None and import_ms + startup_ms > args.budget_ms:
+        print(f"over budget: {import_ms + startup_ms:.0f}ms > {args.budget_ms:.0f}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child()
+        sys.exit()
+    sys.exit(main())
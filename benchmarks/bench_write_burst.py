@@ -0,0 +1,80 @@
+"""Measure read latency and SSE delivery latency while a burst of writes commits.
+
+Runs the app in-process against a scratch database. Reads and event delivery
+should stay flat between the idle and burst phases if writes do not block the
+event loop.
+
+Usage: python -m benchmarks.bench_write_burst [writes]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+READS = 200
+
+
+def pct(samples, q):
+    if not samples:
+        return 0.0
+    return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+
+async def read_loop(client, headers, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await client.get("/books/", params={"limit": 20}, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def main(writes: int):
+    from app.events import event_manager
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not run the lifespan, which creates the schema
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/users/", json={"username": "bench", "password": "bench"})
+        token = (await client.post("/login", data={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        idle = await read_loop(client, headers, READS)
+
+        listener_id, subscriber = await event_manager.register()
+        delivery = []
+
+        async def consume():
+            while True:
+                event = await subscriber.get()
+                sent = datetime.fromisoformat(event["timestamp"])
+                delivery.append((datetime.utcnow() - sent).total_seconds() * 1000)
+
+        consumer = asyncio.create_task(consume())
+        book = {"title": "Burst", "author": "Bench", "genre": "Load"}
+        burst_writes = [client.post("/books/", json=book, headers=headers) for _ in range(writes)]
+        results = await asyncio.gather(read_loop(client, headers, READS), *burst_writes)
+        burst = results[0]
+        while len(delivery) < writes:
+            await asyncio.sleep(0.01)
+        consumer.cancel()
+        event_manager.deregister(listener_id)
+
+    print(f"reads idle:   p50={pct(idle, 50):7.2f}ms  p99={pct(idle, 99):7.2f}ms")
+    print(f"reads burst:  p50={pct(burst, 50):7.2f}ms  p99={pct(burst, 99):7.2f}ms  ({writes} concurrent writes)")
+    print(f"SSE delivery: p50={pct(delivery, 50):7.2f}ms  p99={pct(delivery, 99):7.2f}ms")
+
+
+if __name__ == "__main__":
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app opens ./books.db, so run it from a scratch directory
+        os.chdir(tmp)
+        asyncio.run(main(writes))
@@ -0,0 +1,67 @@
+"""Seed a scratch database with a synthetic book catalog.
+
+The catalog is deterministic for a given size and seed, so runs against
+the same size are comparable. Creates the schema (including the FTS index)
+if the database is new.
+
+Usage: python -m benchmarks.seed [books] [path] [seed]
+"""
+import random
+import sys
+import time
+
+from sqlalchemy import create_engine, insert
+
+from app import migrations, models
+
+GENRES = [
+    "Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "Horror", "History", "Biography",
+    "Poetry", "Drama", "Travel", "Cooking", "Philosophy", "Economics", "Children", "Young Adult",
+    "Comics", "Science", "Religion", "Art",
+]
+WORDS = [
+    "shadow", "river", "winter", "crown", "garden", "empire", "silent", "glass", "storm", "letters",
+    "journey", "secret", "iron", "city", "ocean", "memory", "fire", "stone", "night", "harvest",
+    "mirror", "song", "forest", "island", "clock", "wolf", "paper", "light", "bridge", "orchard",
+]
+BATCH_SIZE = 10_000
+
+
+def catalog(books: int, seed: int = 42):
+    # About 20 books per author, like a real catalog's long tail
+    rng = random.Random(seed)
+    authors = [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}son {i}" for i in range(max(1, books // 20))]
+    for i in range(books):
+        yield {
+            "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title() + f" {i}",
+            "author": rng.choice(authors),
+            "genre": rng.choice(GENRES),
+            "published_date": f"{rng.randint(1900, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "summary": " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 30))),
+        }
+
+
+def seed(path: str, books: int, seed: int = 42) -> float:
+    """Create the schema at path and insert `books` rows; returns seconds taken."""
+    start = time.perf_counter()
+    engine = create_engine(f"sqlite:///{path}")
+    migrations.create_all(engine)
+    batch = []
+    with engine.begin() as connection:
+        for row in catalog(books, seed):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                connection.execute(insert(models.Book), batch)
+                batch.clear()
+        if batch:
+            connection.execute(insert(models.Book), batch)
+    engine.dispose()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    path = sys.argv[2] if len(sys.argv) > 2 else "books.db"
+    rng_seed = int(sys.argv[3]) if len(sys.argv) > 3 else 42
+    elapsed = seed(path, books, rng_seed)
+    print(f"seeded {books} books into {path} in {elapsed:.1f}s")
@@ -0,0 +1,360 @@
+"""Reproducible API benchmark suite with JSON results and baseline comparison.
+
+Seeds a synthetic catalog into a scratch database, then drives each
+scenario for a fixed time with a fixed number of concurrent clients, either
+in-process through the ASGI app or against real uvicorn workers. Reports
+throughput and p50/p95/p99 latency per scenario.
+
+    python -m benchmarks.suite --books 10000 --output results.json
+    python -m benchmarks.suite --mode uvicorn --workers 2 --baseline results.json
+
+With --baseline, exits 1 if any scenario lost more than --tolerance of its
+throughput, or its p95 grew by more than that, or it failed more requests.
+Compare results taken on the same machine, mode and catalog size only.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks.seed import GENRES, seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = 8766
+BASE_URL = f"http://127.0.0.1:{PORT}"
+SCENARIOS = ("login", "list_books", "list_books_cursor", "get_book", "create_book", "update_book", "delete_book", "stream")
+USER = {"username": "bench", "password": "bench"}
+
+
+def pct(samples, q):
+    if not samples:
+        return 0.0
+    return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(pct(latencies, 50), 3),
+        "p95_ms": round(pct(latencies, 95), 3),
+        "p99_ms": round(pct(latencies, 99), 3),
+    }
+
+
+async def asgi_stream(app, path: str, headers: dict):
+    """Yield body chunks of a streaming response straight from the ASGI app.
+
+    httpx.ASGITransport buffers the whole body before returning, which never
+    happens for SSE.
+    """
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "client": ("127.0.0.1", 0), "server": ("bench", 80),
+        "headers": [(b"host", b"bench")] + [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    }
+    chunks = asyncio.Queue()
+    disconnected = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            await chunks.put(message.get("body", b""))
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        while True:
+            yield await chunks.get()
+    finally:
+        disconnected.set()
+        task.cancel()
+
+
+class Target:
+    """Where requests go: the in-process ASGI app or a uvicorn server."""
+
+    def __init__(self, mode: str, app=None):
+        self.mode = mode
+        self.app = app
+
+    def client(self) -> httpx.AsyncClient:
+        if self.mode == "asgi":
+            return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url="http://bench", timeout=60)
+        return httpx.AsyncClient(base_url=BASE_URL, timeout=60, limits=httpx.Limits(max_connections=1000))
+
+    async def lines(self, path: str, headers: dict):
+        if self.mode == "asgi":
+            buffer = b""
+            async for chunk in asgi_stream(self.app, path, headers):
+                buffer += chunk
+                *complete, buffer = buffer.split(b"\n")
+                for line in complete:
+                    yield line.decode()
+        else:
+            async with httpx.AsyncClient(base_url=BASE_URL, timeout=None) as client:
+                async with client.stream("GET", path, headers=headers) as response:
+                    async for line in response.aiter_lines():
+                        yield line
+
+
+async def run_load(request, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def loop():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = (await request()).status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def run_stream(target: Target, client, headers: dict, listeners: int, events: int) -> dict:
+    # Throughput is events delivered per second across all listeners;
+    # latency is commit-to-delivery from the event timestamp
+    latencies = []
+    ready = 0
+
+    async def listen():
+        nonlocal ready
+        received = 0
+        ready += 1
+        async for line in target.lines("/stream/data", {}):
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event.get("type") != "book_created" or event["data"]["title"] != "Stream":
+                continue
+            latencies.append((datetime.utcnow() - datetime.fromisoformat(event["timestamp"])).total_seconds() * 1000)
+            received += 1
+            if received >= events:
+                return
+
+    tasks = [asyncio.create_task(listen()) for _ in range(listeners)]
+    while ready < listeners:
+        await asyncio.sleep(0.05)
+    # Give the server time to register the subscribers
+    await asyncio.sleep(0.5)
+    start = time.perf_counter()
+    book = {"title": "Stream", "author": "Bench", "genre": "Load"}
+    for _ in range(events):
+        await client.post("/books/", json=book, headers=headers)
+    done, pending = await asyncio.wait(tasks, timeout=30)
+    for task in pending:
+        task.cancel()
+    elapsed = time.perf_counter() - start
+    return summarize(latencies, listeners * events - len(latencies), elapsed)
+
+
+async def run_scenarios(target: Target, args) -> dict:
+    rng = random.Random(args.seed)
+    results = {}
+    async with target.client() as client:
+        await client.post("/users/", json=USER)
+        token = (await client.post("/login", data=USER)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        deletes = iter(range(args.books, 0, -1))
+
+        requests = {
+            "login": lambda: client.post("/login", data=USER),
+            "list_books": lambda: client.get(
+                "/books/", params={"skip": rng.randrange(0, min(args.books, 1000)), "limit": 20}, headers=headers),
+            "list_books_cursor": lambda: client.get(
+                "/books/", params={"after": "", "limit": 20, "genre": rng.choice(GENRES)}, headers=headers),
+            "get_book": lambda: client.get(f"/books/{rng.randint(1, args.books)}", headers=headers),
+            "create_book": lambda: client.post(
+                "/books/", json={"title": "Bench", "author": "Bench", "genre": "Load"}, headers=headers),
+            "update_book": lambda: client.put(
+                f"/books/{rng.randint(1, args.books // 2)}",
+                json={"title": "Updated", "author": "Bench", "genre": "Load"}, headers=headers),
+            "delete_book": lambda: client.delete(f"/books/{next(deletes, 0)}", headers=headers),
+        }
+        for name in args.scenarios:
+            if name == "stream":
+                results[name] = await run_stream(target, client, headers, args.listeners, args.events)
+            else:
+                results[name] = await run_load(requests[name], args.concurrency, args.duration)
+            print_row(name, results[name])
+    return results
+
+
+def print_row(name: str, result: dict):
+    print(
+        f"{name:18} {result['throughput']:9.1f}/s  p50={result['p50_ms']:8.2f}ms  "
+        f"p95={result['p95_ms']:8.2f}ms  p99={result['p99_ms']:8.2f}ms  errors={result['errors']}",
+        flush=True,
+    )
+
+
+async def run_asgi(args) -> dict:
+    from app.main import app
+
+    # ASGITransport does not run the lifespan; enter it like uvicorn would
+    async with app.router.lifespan_context(app):
+        return await run_scenarios(Target("asgi", app), args)
+
+
+async def wait_until_up(timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=BASE_URL) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get("/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not start")
+
+
+def run_uvicorn(args, workdir: str) -> dict:
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT,
+        "DATABASE_URL": f"sqlite:///{workdir}/books.db",
+        "SECRET_KEY": "benchmark-secret",
+        # Workers only see each other's SSE events through the sqlite bus
+        "EVENT_BACKEND": "sqlite" if args.workers > 1 else os.environ.get("EVENT_BACKEND", "local"),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    try:
+        asyncio.run(wait_until_up())
+        return asyncio.run(run_scenarios(Target("uvicorn"), args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, current in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        if base["throughput"] and current["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput']}/s vs baseline {base['throughput']}/s")
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (uvicorn mode)")
+    parser.add_argument("--books", type=int, default=10_000, help="size of the seeded catalog")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients per scenario")
+    parser.add_argument("--listeners", type=int, default=20, help="SSE clients in the stream scenario")
+    parser.add_argument("--events", type=int, default=50, help="writes observed by the stream scenario")
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=list(SCENARIOS),
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        seconds = seed(os.path.join(workdir, "books.db"), args.books, args.seed)
+        print(f"seeded {args.books} books in {seconds:.1f}s; mode={args.mode} workers={args.workers} "
+              f"concurrency={args.concurrency} duration={args.duration}s", flush=True)
+        if args.mode == "asgi":
+            # The app reads DATABASE_URL at import, and the sqlite event bus uses ./events.db
+            os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/books.db"
+            os.chdir(workdir)
+            scenarios = asyncio.run(run_asgi(args))
+            os.chdir(ROOT)
+        else:
+            scenarios = run_uvicorn(args, workdir)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "commit": git_commit(),
+            "mode": args.mode,
+            "workers": args.workers,
+            "books": args.books,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "listeners": args.listeners,
+            "events": args.events,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "scenarios": scenarios,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        mismatched = [key for key in ("mode", "workers", "books", "concurrency", "duration", "cpus")
+                      if baseline.get("meta", {}).get(key) != results["meta"][key]]
+        if mismatched:
+            print(f"warning: baseline was taken with different {', '.join(mismatched)}")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
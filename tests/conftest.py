@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import httpx
+import pytest_asyncio
+
+# Before anything imports app.db: the app under test works in a scratch
+# directory, never on ./books.db
+SCRATCH = tempfile.mkdtemp(prefix="book-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{SCRATCH}/books.db",
+    "EVENT_BUS_PATH": f"{SCRATCH}/events.db",
+    "PROFILE_DIR": f"{SCRATCH}/profiles",
+    "RATE_LIMIT_PATH": f"{SCRATCH}/ratelimit.bin",
+    "RATE_LIMIT_ENABLED": "false",
+})
+
+
+@pytest_asyncio.fixture
+async def client():
+    # ASGITransport does not run the lifespan, which migrates the schema
+    from app import auth
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'tester'})}"}
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", headers=headers) as c:
+        yield c
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: starts real uvicorn workers; deselect with -m 'not slow'")
@@ -0,0 +1,132 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import crud, models, schemas, stats
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    path = tmp_path / "books.db"
+    models.Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        await stats.ensure(session)
+        yield session
+    await engine.dispose()
+
+
+def book(title: str, author: str = "Le Guin", genre: str = "Fiction", **fields) -> dict:
+    return {"title": title, "author": author, "genre": genre, "published_date": "1969-03-01", **fields}
+
+
+def operations(*ops: dict) -> list[schemas.BatchOperation]:
+    return schemas.BatchRequest(operations=list(ops)).operations
+
+
+async def seed(db, *books: dict) -> list[int]:
+    results, _ = await crud.apply_batch(db, operations(*({"op": "create", "book": b} for b in books)))
+    return [result["id"] for result in results]
+
+
+async def versions(db) -> dict[int, int]:
+    return dict((await db.execute(select(models.Book.id, models.Book.version))).all())
+
+
+@pytest.mark.asyncio
+async def test_mixed_batch_keeps_stats_consistent(db):
+    a, b, c = await seed(db, book("A"), book("B", genre="Poetry"), book("C", author="Herbert"))
+    results, committed = await crud.apply_batch(db, operations(
+        {"op": "create", "book": book("D", author="Butler", genre="SF")},
+        # Genre and author moves
+        {"op": "update", "id": a, "book": book("A", genre="SF")},
+        {"op": "update", "id": b, "book": book("B", author="Herbert", genre="Poetry")},
+        {"op": "delete", "id": c},
+        {"op": "delete", "id": 999},
+    ))
+    assert committed
+    assert [result["status"] for result in results] == [201, 200, 200, 200, 404]
+    assert await stats.verify(db) == []
+    counts = await stats.get_stats(db, authors_limit=10)
+    assert counts["total"] == 3
+    assert counts["genres"] == {"SF": 2, "Poetry": 1}
+    assert counts["authors"] == {"Butler": 1, "Herbert": 1, "Le Guin": 1}
+
+
+@pytest.mark.asyncio
+async def test_update_then_delete_writes_only_the_delete(db):
+    (a,) = await seed(db, book("A"))
+    results, committed = await crud.apply_batch(db, operations(
+        {"op": "update", "id": a, "book": book("A2", genre="SF")},
+        {"op": "delete", "id": a, "version": 2},
+    ))
+    assert committed and [result["status"] for result in results] == [200, 200]
+    assert await versions(db) == {}
+    assert await stats.verify(db) == []
+    assert (await stats.get_stats(db, authors_limit=10))["total"] == 0
+
+
+@pytest.mark.asyncio
+async def test_repeated_updates_bump_the_version_each_time(db):
+    (a,) = await seed(db, book("A"))
+    results, _ = await crud.apply_batch(db, operations(
+        {"op": "update", "id": a, "book": book("A1")},
+        {"op": "update", "id": a, "book": book("A2", genre="SF"), "version": 2},
+        # Stale version: rejected, the earlier updates still apply
+        {"op": "update", "id": a, "book": book("A3"), "version": 1},
+    ))
+    assert [(result["status"], result.get("version")) for result in results] == [(200, 2), (200, 3), (412, None)]
+    row = (await db.execute(select(models.Book.title, models.Book.genre, models.Book.version))).one()
+    assert tuple(row) == ("A2", "SF", 3)
+    assert await stats.verify(db) == []
+
+
+@pytest.mark.asyncio
+async def test_atomic_batch_writes_nothing_on_failure(db):
+    (a,) = await seed(db, book("A"))
+    results, committed = await crud.apply_batch(db, operations(
+        {"op": "create", "book": book("B")},
+        {"op": "delete", "id": a},
+        {"op": "update", "id": a, "book": book("A2")},
+    ), atomic=True)
+    assert not committed
+    assert results[2]["status"] == 404
+    assert await versions(db) == {a: 1}
+    assert await stats.verify(db) == []
+
+
+@pytest.mark.asyncio
+async def test_stats_without_upsert(db, monkeypatch):
+    # Dialects without an upsert form fall back to UPDATE, then INSERT
+    monkeypatch.setattr(stats, "UPSERT_DIALECTS", {})
+    a, b = await seed(db, book("A"), book("B"))
+    await crud.apply_batch(db, operations(
+        {"op": "update", "id": a, "book": book("A", author="Herbert")},
+        {"op": "delete", "id": b},
+        {"op": "create", "book": book("C", genre="SF")},
+    ))
+    assert await stats.verify(db) == []
+    assert (await stats.get_stats(db, authors_limit=10))["genres"] == {"Fiction": 1, "SF": 1}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("multi_rowcount, returning", [(True, True), (False, True), (False, False)])
+async def test_update_books_detects_concurrent_writes(db, monkeypatch, multi_rowcount, returning):
+    # Drivers without an executemany row count check row by row
+    monkeypatch.setattr(db.bind.dialect, "supports_sane_multi_rowcount", multi_rowcount)
+    monkeypatch.setattr(db.bind.dialect, "update_returning", returning)
+    a, b = await seed(db, book("A"), book("B"))
+    rows = await crud.get_books_by_ids(db, [a, b])
+    for row in rows.values():
+        row.update(title=row["title"] + "2", version=row["version"] + 1)
+    # b was read at version 1 but another writer is assumed to have moved it on
+    with pytest.raises(crud.BatchConflict):
+        await crud.update_books(db, list(rows.values()), {a: 1, b: 0})
+    await db.rollback()
+    rows = await crud.get_books_by_ids(db, [a, b])
+    for row in rows.values():
+        row.update(version=2)
+    await crud.update_books(db, list(rows.values()), {a: 1, b: 1})
+    await db.commit()
+    assert await versions(db) == {a: 2, b: 2}
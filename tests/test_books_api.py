@@ -0,0 +1,54 @@
+import pytest
+
+
+def book(title: str, **fields) -> dict:
+    return {"title": title, "author": "Le Guin", "genre": "Fiction", "published_date": "1969-03-01", **fields}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("params", [
+    {"limit": 0},
+    {"limit": -1},
+    {"limit": -2},
+    {"limit": 101},
+    {"skip": -1},
+    {"after": "", "limit": 0},
+    {"after": "", "limit": -2},
+    {"after": "", "order": "title", "limit": 0},
+])
+async def test_list_rejects_out_of_range_paging(client, params):
+    assert (await client.get("/books/", params=params)).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_cursor_pages_cover_the_catalog(client):
+    for i in range(5):
+        assert (await client.post("/books/", json=book(f"Cursor {i}", genre="Cursor"))).status_code == 200
+    titles, after = [], ""
+    while after is not None:
+        page = (await client.get("/books/", params={"after": after, "limit": 2, "genre": "Cursor"})).json()
+        titles += [item["title"] for item in page["items"]]
+        after = page["next_cursor"]
+    assert titles == [f"Cursor {i}" for i in range(5)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("params", [{"skip": -1}, {"limit": 0}, {"limit": 101}])
+async def test_search_rejects_out_of_range_paging(client, params):
+    assert (await client.get("/books/search", params={"q": "dune", **params})).status_code == 422
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("params", [{"after": "", "sort": "-title"}, {"after": "", "order": "title", "sort": "id"}])
+async def test_cursor_paging_rejects_sort(client, params):
+    response = await client.get("/books/", params=params)
+    assert response.status_code == 400
+    assert "order" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_skip_paging_applies_sort(client):
+    for title in ("Sort B", "Sort C", "Sort A"):
+        await client.post("/books/", json=book(title, genre="Sort"))
+    page = (await client.get("/books/", params={"genre": "Sort", "sort": "-title"})).json()
+    assert [item["title"] for item in page] == ["Sort C", "Sort B", "Sort A"]
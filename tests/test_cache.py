@@ -0,0 +1,23 @@
+import datetime
+
+from app.cache import BookCache
+
+
+def test_set_sizes_entries_and_evicts_to_max_bytes():
+    page = [(i, f"Title {i}", datetime.date(1990, 1, 1)) for i in range(10)]
+    cache = BookCache(max_entries=10, max_bytes=3 * 400, ttl=60)
+    for skip in range(5):
+        cache.set(("books", skip), page, cache.generation)
+    stats = cache.stats()
+    assert 0 < stats["bytes"] <= cache.max_bytes
+    assert cache.get(("books", 4)) == page
+    assert cache.get(("books", 0)) is None
+
+
+def test_set_skips_oversized_and_stale_fills():
+    cache = BookCache(max_entries=10, max_bytes=1000, ttl=60)
+    cache.set(("books", 0), ["x" * 2000], cache.generation)
+    generation = cache.generation
+    cache.invalidate_lists()
+    cache.set(("books", 1), ["x"], generation)
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,122 @@
+"""Two uvicorn workers sharing the sqlite event bus: a write on one must
+invalidate the other's read cache and reach SSE clients on both."""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKERS = 2
+# Enough fresh connections that both workers serve some of them
+SPREAD = 20
+
+pytestmark = [pytest.mark.slow, pytest.mark.asyncio]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server(tmp_path):
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT,
+        "DATABASE_URL": f"sqlite:///{tmp_path}/books.db",
+        "EVENT_BACKEND": "sqlite",
+        "EVENT_BUS_PATH": str(tmp_path / "events.db"),
+        "SECRET_KEY": "test-multiworker",
+    }
+    # Migrate once so workers do not race on the schema
+    subprocess.run([sys.executable, "-m", "app.migrations", "upgrade"], cwd=tmp_path, env=env, check=True,
+                   capture_output=True)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(WORKERS), "--log-level", "warning"],
+        cwd=tmp_path, env=env,
+    )
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+async def connect(base_url: str) -> dict:
+    deadline = time.monotonic() + 30
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while True:
+            try:
+                await client.get("/")
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+        await client.post("/users/", json={"username": "tester", "password": "secret"})
+        token = (await client.post("/login", data={"username": "tester", "password": "secret"})).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def fresh_connections(base_url: str, headers: dict) -> httpx.AsyncClient:
+    # No keep-alive: every request is a new connection, accepted by either worker
+    return httpx.AsyncClient(base_url=base_url, headers=headers, limits=httpx.Limits(max_keepalive_connections=0))
+
+
+async def test_writes_invalidate_every_workers_cache(server):
+    headers = await connect(server)
+    book = {"title": "Before", "author": "Le Guin", "genre": "Fiction", "published_date": "1969-03-01"}
+    async with fresh_connections(server, headers) as client:
+        book_id = (await client.post("/books/", json=book)).json()["id"]
+        # Warm both workers' caches for the book and the first page
+        for _ in range(SPREAD):
+            assert (await client.get(f"/books/{book_id}")).json()["title"] == "Before"
+            assert (await client.get("/books/")).json()[0]["title"] == "Before"
+
+        await client.put(f"/books/{book_id}", json={**book, "title": "After"})
+        deadline = time.monotonic() + 5
+        while True:
+            titles = set()
+            for _ in range(SPREAD):
+                titles.add((await client.get(f"/books/{book_id}")).json()["title"])
+                titles.add((await client.get("/books/")).json()[0]["title"])
+            if titles == {"After"} or time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.1)
+        assert titles == {"After"}
+
+
+async def listen(base_url: str, ready: asyncio.Event, expected: int) -> list[int]:
+    seqs = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        async with client.stream("GET", "/stream/data") as response:
+            ready.set()
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    seqs.append(httpx.Response(200, content=line[6:]).json()["seq"])
+                    if len(seqs) == expected:
+                        return seqs
+    return seqs
+
+
+async def test_events_reach_listeners_on_every_worker(server):
+    headers = await connect(server)
+    writes = 10
+    readies = [asyncio.Event() for _ in range(WORKERS * 3)]
+    listeners = [asyncio.create_task(listen(server, ready, writes)) for ready in readies]
+    await asyncio.wait_for(asyncio.gather(*(ready.wait() for ready in readies)), timeout=10)
+    await asyncio.sleep(0.5)
+    async with fresh_connections(server, headers) as client:
+        for i in range(writes):
+            await client.post("/books/", json={"title": f"Book {i}", "author": "Butler", "genre": "SF"})
+    received = await asyncio.wait_for(asyncio.gather(*listeners), timeout=15)
+    for seqs in received:
+        assert len(seqs) == writes and seqs == sorted(seqs)
@@ -0,0 +1,109 @@
+import pytest
+
+from app import ratelimit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["local", "shared"])
+def backend(request, tmp_path, clock):
+    if request.param == "local":
+        yield ratelimit.LocalBackend()
+        return
+    backend = ratelimit.SharedBackend(str(tmp_path / "ratelimit.bin"), slots=64)
+    yield backend
+    backend.close()
+
+
+def test_burst_then_refill(backend, clock):
+    assert [backend.take("a", 2.0, 3.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert backend.take("a", 2.0, 3.0) == pytest.approx(0.5)
+    clock[0] += 0.25
+    # Half a token has accrued; the rejected attempt spent nothing
+    assert backend.take("a", 2.0, 3.0) == pytest.approx(0.25)
+    clock[0] += 0.25
+    assert backend.take("a", 2.0, 3.0) == 0.0
+    assert backend.take("a", 2.0, 3.0) > 0
+
+
+def test_refill_is_capped_at_burst(backend, clock):
+    for _ in range(3):
+        backend.take("a", 1.0, 3.0)
+    clock[0] += 60
+    assert [backend.take("a", 1.0, 3.0) for _ in range(4)][-2:] == [0.0, pytest.approx(1.0)]
+
+
+def test_keys_are_independent(backend, clock):
+    assert backend.take("a", 1.0, 1.0) == 0.0
+    assert backend.take("a", 1.0, 1.0) > 0
+    assert backend.take("b", 1.0, 1.0) == 0.0
+
+
+def test_local_evicts_least_recently_used(clock):
+    backend = ratelimit.LocalBackend(max_keys=2)
+    backend.take("a", 1.0, 1.0)
+    backend.take("b", 1.0, 1.0)
+    backend.take("a", 1.0, 1.0)
+    backend.take("c", 1.0, 1.0)
+    assert list(backend.buckets) == ["a", "c"]
+    # An evicted client starts over with a full bucket
+    assert backend.take("b", 1.0, 1.0) == 0.0
+
+
+@pytest.mark.parametrize("method, path, budget", [
+    ("GET", "/", None),
+    ("GET", "/metrics", None),
+    ("POST", "/login", "login"),
+    ("POST", "/users/", "login"),
+    ("GET", "/stream/data", "sse"),
+    ("HEAD", "/books/1", "read"),
+    ("DELETE", "/books/1", "write"),
+])
+def test_budget_for(method, path, budget):
+    assert ratelimit.budget_for(method, path) == budget
+
+
+def scope(forwarded: str | None = None, peer: str = "10.1.2.3") -> dict:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded is not None else []
+    return {"type": "http", "method": "POST", "path": "/login", "headers": headers, "client": (peer, 443)}
+
+
+@pytest.mark.parametrize("forwarded, hops, address", [
+    (None, 1, "10.1.2.3"),
+    ("198.51.100.1", 0, "10.1.2.3"),
+    ("198.51.100.1", 1, "198.51.100.1"),
+    ("1.1.1.1, 2.2.2.2, 198.51.100.1", 1, "198.51.100.1"),
+    ("1.1.1.1, 198.51.100.1, 172.16.0.1", 2, "198.51.100.1"),
+    # Fewer entries than trusted proxies: not forwarded as expected
+    ("198.51.100.1", 2, "10.1.2.3"),
+])
+def test_client_address(forwarded, hops, address):
+    assert ratelimit.client_address(scope(forwarded), hops) == address
+
+
+@pytest.mark.asyncio
+async def test_spoofed_forwarded_for_is_still_limited(clock):
+    # Behind one router that appends the real address, a forged leading
+    # X-Forwarded-For must not buy a fresh bucket
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 401, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    limiter = ratelimit.RateLimiter(ratelimit.LocalBackend(), budgets={"login": (0.2, 10.0)},
+                                    enabled=True, trusted_hops=1)
+    middleware = ratelimit.RateLimitMiddleware(app, limiter)
+    statuses = []
+    for i in range(12):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(scope(f"203.0.113.{i}, 198.51.100.7", peer="10.1.2.3"), None, send)
+        statuses.append(sent[0]["status"])
+    assert statuses == [401] * 10 + [429] * 2
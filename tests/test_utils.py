@@ -0,0 +1,79 @@
+import pytest
+
+from app import utils
+
+
+async def chunked(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1024])
+async def test_ndjson_rows_split_inside_character(size):
+    body = '{"title": "Cien años de soledad"}\n{"title": "Ðœ"}\n'.encode()
+    rows = await collect(utils.iter_ndjson_rows(chunked(body, size)))
+    assert rows == [(1, {"title": "Cien años de soledad"}), (2, {"title": "Ðœ"})]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_rows_report_bad_lines():
+    body = b'{"title": "A"}\n\nnot json\r\n{"title": "B"}'
+    rows = await collect(utils.iter_ndjson_rows(chunked(body, 4)))
+    assert rows[0] == (1, {"title": "A"})
+    assert rows[1][0] == 3 and isinstance(rows[1][1], ValueError)
+    assert rows[2] == (4, {"title": "B"})
+
+
+@pytest.mark.asyncio
+async def test_ndjson_rows_truncated_character():
+    with pytest.raises(UnicodeDecodeError):
+        await collect(utils.iter_ndjson_rows(chunked('{"title": "ñ"}'.encode()[:-3], 4)))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 2, 5, 1024])
+async def test_csv_rows_split_inside_character(size):
+    body = "title,author\r\nCien años,García Márquez\r\n".encode()
+    rows = await collect(utils.iter_csv_rows(chunked(body, size)))
+    assert rows == [(2, {"title": "Cien años", "author": "García Márquez"})]
+
+
+@pytest.mark.asyncio
+async def test_csv_rows_join_quoted_lines():
+    body = b'title,summary,genre\n"A, B","line one\nline ""two""",\nC,D,E\n'
+    rows = await collect(utils.iter_csv_rows(chunked(body, 3)))
+    assert rows == [
+        (2, {"title": "A, B", "summary": 'line one\nline "two"', "genre": None}),
+        (4, {"title": "C", "summary": "D", "genre": "E"}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_csv_rows_errors():
+    body = b'title,author\nA\n"B,unterminated\n'
+    rows = await collect(utils.iter_csv_rows(chunked(body, 1024)))
+    assert [row_no for row_no, _ in rows] == [2, 3]
+    assert all(isinstance(error, ValueError) for _, error in rows)
+    assert "Unterminated" in str(rows[1][1])
+
+
+@pytest.mark.parametrize("order, key", [("id", (42,)), ("title", ("Dune", 3)), ("title", ("Cien años", 9))])
+def test_cursor_round_trip(order, key):
+    assert utils.decode_cursor(utils.encode_cursor(order, key), order) == key
+
+
+@pytest.mark.parametrize("cursor, order", [
+    ("not base64!", "id"),
+    (utils.encode_cursor("id", (1,)), "title"),
+    (utils.encode_cursor("title", (1, 2)), "title"),
+    (utils.encode_cursor("id", ("1",)), "id"),
+    (utils.encode_cursor("id", (1, 2)), "id"),
+])
+def test_cursor_rejects_bad_tokens(cursor, order):
+    with pytest.raises(ValueError):
+        utils.decode_cursor(cursor, order)